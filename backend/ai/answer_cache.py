@@ -0,0 +1,112 @@
+"""
+Semantic answer cache for /api/search AI suggestions.
+
+An answer is reused when a new query's embedding is within
+`threshold` cosine similarity of a cached query AND retrieval returned the
+same set of documents, so the LLM would have seen identical context.
+Entries expire after `ttl` seconds; the least recently used entry is evicted
+once `maxsize` is reached.
+"""
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def doc_signature(docs) -> frozenset:
+    """Order-independent identity of a retrieved doc set."""
+    return frozenset(hashlib.sha1(d["text"].encode("utf-8")).hexdigest()[:16] for d in docs)
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold: float = 0.95, ttl: float = 3600, maxsize: int = 1024):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()   # id -> (unit vector, doc signature, value, expires_at)
+        self._next_id = 0
+        self._matrix = None             # stacked vectors, rebuilt lazily
+        self._matrix_ids = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.doc_mismatches = 0         # similar query, different retrieval
+        self.expired = 0
+        self.evicted = 0
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype="float32")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _purge_expired(self, now):
+        stale = [eid for eid, entry in self._entries.items() if entry[3] <= now]
+        for eid in stale:
+            del self._entries[eid]
+        if stale:
+            self.expired += len(stale)
+            self._matrix = None
+
+    def get(self, vector, docs):
+        """Return the cached answer for a similar query with the same docs, else None."""
+        query = self._unit(vector)
+        signature = doc_signature(docs)
+        now = time.time()
+
+        with self._lock:
+            self._purge_expired(now)
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            if self._matrix is None:
+                self._matrix_ids = list(self._entries)
+                self._matrix = np.stack([self._entries[eid][0] for eid in self._matrix_ids])
+
+            similarity = self._matrix @ query
+            similar_but_other_docs = False
+            for pos in np.argsort(-similarity):
+                if similarity[pos] < self.threshold:
+                    break
+                eid = self._matrix_ids[pos]
+                if self._entries[eid][1] == signature:
+                    self._entries.move_to_end(eid)
+                    self.hits += 1
+                    return self._entries[eid][2]
+                similar_but_other_docs = True
+
+            if similar_but_other_docs:
+                self.doc_mismatches += 1
+            self.misses += 1
+            return None
+
+    def set(self, vector, docs, value) -> None:
+        with self._lock:
+            self._entries[self._next_id] = (
+                self._unit(vector), doc_signature(docs), value, time.time() + self.ttl,
+            )
+            self._next_id += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+            self._matrix = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "doc_mismatches": self.doc_mismatches,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+                "threshold": self.threshold,
+                "ttl": self.ttl,
+            }
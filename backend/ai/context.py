@@ -0,0 +1,145 @@
+"""
+Context packing for ai_suggest / ai_chat.
+
+Retrieved docs are often long (ingest chunks run up to 600 words) and
+redundant (several "(part N)" chunks of one source). Before they go into a
+prompt we:
+  1. drop near-duplicate chunks (word-shingle Jaccard similarity)
+  2. reorder MMR-style: keep retrieval rank as relevance, but penalize
+     chunks that overlap with, or come from the same document as, ones already picked
+  3. pack them into a token budget, trimming the last one at a sentence
+     boundary instead of mid-word
+"""
+
+import re
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")   # gpt-4o family
+except Exception:   # not installed or encoding files unavailable offline
+    _ENCODING = None
+
+DUPLICATE_THRESHOLD = 0.8    # Jaccard above this = same passage
+MMR_LAMBDA = 0.7             # 1.0 = pure retrieval order, 0.0 = pure diversity
+SAME_SOURCE_SIMILARITY = 0.5 # how "similar" two chunks of one document count as
+
+_SENTENCE_END = re.compile(r"(?<=[.!?\u061f])\s+|\n+")
+_WORD = re.compile(r"\w+")
+_PART_SUFFIX = re.compile(r"\s*\(part \d+(?:/\d+)?\)\s*$", re.IGNORECASE)
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    # Fallback estimate: ~4 chars/token for Latin script, ~2.5 for Persian
+    persian = sum(1 for ch in text if "\u0600" <= ch <= "\u06ff")
+    return int((len(text) - persian) / 4 + persian / 2.5) + 1
+
+
+def _shingles(text: str, n: int = 3) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) < n:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _trim_to_budget(text: str, budget: int) -> str:
+    """
+    Longest prefix of whole sentences that fits in `budget` tokens. Scraped
+    text sometimes has no punctuation at all; then cut at a word boundary.
+    """
+    kept, used = [], 0
+    for sentence in _SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        cost = count_tokens(sentence) + 1
+        if used + cost > budget:
+            break
+        kept.append(sentence)
+        used += cost
+    if kept:
+        return " ".join(kept)
+
+    words = text.split()
+    lo, hi = 0, len(words)
+    while lo < hi:   # binary search the longest word prefix within budget
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid])) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo])
+
+
+def _origin(doc: dict) -> str:
+    """Chunks "X (part 2)" and "X (part 3)" of one document share an origin."""
+    title = _PART_SUFFIX.sub("", doc.get("title", ""))
+    return f"{doc.get('source', '')}|{title}"
+
+
+def select_docs(docs: list) -> list:
+    """De-duplicate and MMR-reorder docs (given in retrieval order)."""
+    candidates = []
+    for rank, doc in enumerate(docs):
+        text = doc.get("text", "")
+        if not text.strip():
+            continue
+        candidates.append({
+            "doc": doc,
+            "relevance": 1.0 / (rank + 1),
+            "shingles": _shingles(text),
+            "origin": _origin(doc),
+        })
+
+    selected = []
+    while candidates:
+        best, best_score = None, None
+        for cand in candidates:
+            redundancy = 0.0
+            for picked in selected:
+                sim = _jaccard(cand["shingles"], picked["shingles"])
+                if cand["origin"] == picked["origin"]:
+                    sim = max(sim, SAME_SOURCE_SIMILARITY)
+                redundancy = max(redundancy, sim)
+            if redundancy >= DUPLICATE_THRESHOLD:
+                cand["duplicate"] = True
+                continue
+            score = MMR_LAMBDA * cand["relevance"] - (1 - MMR_LAMBDA) * redundancy
+            if best_score is None or score > best_score:
+                best, best_score = cand, score
+        candidates = [c for c in candidates if c is not best and not c.get("duplicate")]
+        if best is not None:
+            selected.append(best)
+
+    return [c["doc"] for c in selected]
+
+
+def build_context(docs: list, budget: int) -> str:
+    """
+    Pack the most useful passages of `docs` into at most `budget` tokens
+    (each prompt has its own, see ai/openai_client.py).
+    """
+    parts, used = [], 0
+    for doc in select_docs(docs or []):
+        text = doc["text"].strip()
+        cost = count_tokens(text)
+        remaining = budget - used
+        if cost > remaining:
+            text = _trim_to_budget(text, remaining)
+            if not text:
+                break
+            cost = count_tokens(text)
+        parts.append(text)
+        used += cost + 1   # + separator
+        if used >= budget:
+            break
+    return "\n\n".join(parts)
@@ -0,0 +1,347 @@
+"""
+LLM Gateway
+===========
+The one place that talks to the OpenAI API. Every feature (search
+embeddings, suggestions, chat, assessment, blog generation, index builds)
+goes through the two pooled clients defined here, so connections are reused
+across features and upstream behavior is tuned in one place:
+
+  LLM_MAX_CONNECTIONS / LLM_KEEPALIVE_CONNECTIONS / LLM_KEEPALIVE_EXPIRY
+      size of the shared HTTP connection pool
+  LLM_TIMEOUT / LLM_CONNECT_TIMEOUT
+      default per-attempt timeouts (seconds); slow calls (long generations,
+      images) pass their own timeout=
+  LLM_DEADLINE
+      default total time budget of one call, retries included; a call's
+      deadline= is raised to its own timeout= if that is longer
+  LLM_MAX_RETRIES
+      retries on 429 / 5xx / connection errors, with jittered exponential
+      backoff (Retry-After is honored when the API sends it)
+  LLM_CONCURRENCY
+      max upstream calls in flight per process — sync callers (threads) and
+      async callers (event loop) each get this many slots
+  RATE_LIMITS / RATE_LIMIT_DB
+      requests/min and tokens/min per model (unset = tier-1 defaults),
+      shared by every process on the box, see ai/ratelimit.py; calls pass
+      priority=BATCH for background work so user traffic goes first
+
+Usage:
+    from ai import gateway
+    resp = gateway.chat(model=..., messages=...)          # sync
+    resp = await gateway.achat(model=..., messages=...)   # async
+    async for chunk in gateway.astream(model=..., messages=...): ...
+    gateway.call(gateway.client.images.generate, ..., timeout=180, deadline=300)
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+import weakref
+
+import httpx
+import openai
+from openai import OpenAI, AsyncOpenAI
+from dotenv import load_dotenv
+
+from ai.context import count_tokens
+from ai.ratelimit import limiter, INTERACTIVE, BATCH
+
+load_dotenv()
+
+LLM_TIMEOUT               = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT       = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_DEADLINE              = float(os.getenv("LLM_DEADLINE", "90"))
+LLM_MAX_RETRIES           = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_CONCURRENCY           = int(os.getenv("LLM_CONCURRENCY", "16"))
+LLM_MAX_CONNECTIONS       = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY      = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+
+BACKOFF_BASE = 0.5    # seconds; attempt n waits up to BACKOFF_BASE * 2**n
+BACKOFF_CAP  = 20.0
+COMPLETION_ESTIMATE = 500   # reply tokens assumed when a call sets no max_tokens
+
+_limits  = httpx.Limits(
+    max_connections=LLM_MAX_CONNECTIONS,
+    max_keepalive_connections=LLM_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+)
+_timeout = httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+# Retries are done here (not by the SDK) so they share the deadline and
+# the concurrency slots
+client = OpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    max_retries=0,
+    http_client=openai.DefaultHttpxClient(limits=_limits, timeout=_timeout),
+)
+async_client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    max_retries=0,
+    http_client=openai.DefaultAsyncHttpxClient(limits=_limits, timeout=_timeout),
+)
+
+
+# ── retry policy ────────────────────────────────────────────────────────────
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code == 429 or exc.status_code >= 500
+    return False
+
+
+def retry_after(exc: Exception):
+    """Seconds the API asked us to wait (Retry-After header), if any."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def _backoff(attempt: int, exc: Exception) -> float:
+    hinted = retry_after(exc)
+    if hinted is not None:
+        return min(hinted, BACKOFF_CAP * 3)
+    # "Full jitter": spreads out retries from callers that failed together
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def _deadline_exceeded():
+    return openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com"))
+
+
+def estimate_tokens(kwargs: dict) -> int:
+    """Up-front token cost of a call, for the tokens/min bucket."""
+    if "messages" in kwargs:
+        prompt = sum(count_tokens(str(m.get("content") or "")) + 4 for m in kwargs["messages"])
+        return prompt + (kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or COMPLETION_ESTIMATE)
+    if "input" in kwargs:
+        texts = kwargs["input"]
+        return sum(count_tokens(t) for t in ([texts] if isinstance(texts, str) else texts))
+    return 0
+
+
+class _Attempts:
+    """
+    Shared bookkeeping of call() / acall() / astream(): deadline, retry
+    budget, rate-limiter admission and logging.
+    """
+
+    def __init__(self, fn, deadline, retries, priority, kwargs, timeout=None):
+        self.name = getattr(fn, "__qualname__", repr(fn))
+        self.attempt_timeout = timeout if timeout is not None else LLM_TIMEOUT
+        budget = deadline if deadline is not None else LLM_DEADLINE
+        if timeout is not None:
+            # An explicit per-attempt timeout always fits in the budget
+            budget = max(budget, timeout)
+        self.deadline = time.monotonic() + budget
+        self.retries = LLM_MAX_RETRIES if retries is None else retries
+        self.attempt = 0
+        self.priority = priority
+        self.model = kwargs.get("model")
+        self.cost = estimate_tokens(kwargs)
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def timeout(self) -> float:
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise _deadline_exceeded()
+        return min(self.attempt_timeout, remaining)
+
+    def admit(self) -> None:
+        """Wait for the rate limiter; a queue wait past the deadline is a timeout."""
+        if not limiter.acquire(self.model, self.cost, self.priority, timeout=self.remaining()):
+            raise _deadline_exceeded()
+
+    async def aadmit(self) -> None:
+        if not await limiter.aacquire(self.model, self.cost, self.priority, timeout=self.remaining()):
+            raise _deadline_exceeded()
+
+    def settle(self, usage) -> None:
+        limiter.settle(self.model, self.cost, getattr(usage, "total_tokens", None))
+
+    async def asettle(self, usage) -> None:
+        await limiter.offload(self.settle, usage)
+
+    def next_delay(self, exc: Exception):
+        """Delay before the next attempt, or None if `exc` should be raised."""
+        # The failed attempt gives its estimated tokens back; the next one is charged again
+        limiter.settle(self.model, self.cost, 0)
+        delay = _backoff(self.attempt, exc)
+        if isinstance(exc, openai.RateLimitError) or getattr(exc, "status_code", None) == 429:
+            # Everyone else calling this model would hit the same limit
+            limiter.penalize(self.model, delay)
+        if self.attempt >= self.retries or not is_retryable(exc):
+            return None
+        if time.monotonic() + delay >= self.deadline:
+            return None
+        self.attempt += 1
+        _stats.bump("retries")
+        print(f"[llm] {self.name} failed ({exc.__class__.__name__}), "
+              f"retry {self.attempt}/{self.retries} in {delay:.1f}s")
+        return delay
+
+    async def anext_delay(self, exc: Exception):
+        return await limiter.offload(self.next_delay, exc)
+
+
+# ── concurrency limit ───────────────────────────────────────────────────────
+
+_sync_slots  = threading.BoundedSemaphore(LLM_CONCURRENCY)
+_async_slots = weakref.WeakKeyDictionary()   # event loop -> asyncio.Semaphore
+
+
+def _async_slot() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    slot = _async_slots.get(loop)
+    if slot is None:
+        slot = _async_slots[loop] = asyncio.Semaphore(LLM_CONCURRENCY)
+    return slot
+
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"calls": 0, "retries": 0, "failures": 0, "in_flight": 0}
+
+    def bump(self, name: str, delta: int = 1) -> None:
+        with self._lock:
+            self.counts[name] += delta
+
+
+_stats = _Stats()
+
+
+# ── calls ───────────────────────────────────────────────────────────────────
+
+def call(fn, *args, deadline: float = None, retries: int = None, priority: int = INTERACTIVE,
+         timeout: float = None, **kwargs):
+    """
+    Run a sync SDK method (e.g. client.embeddings.create) under the gateway
+    policy. `timeout` caps each attempt (default LLM_TIMEOUT), `deadline`
+    the whole call including retries (default LLM_DEADLINE).
+    """
+    attempts = _Attempts(fn, deadline, retries, priority, kwargs, timeout)
+    _stats.bump("calls")
+    while True:
+        attempts.admit()
+        with _sync_slots:
+            _stats.bump("in_flight")
+            try:
+                response = fn(*args, timeout=attempts.timeout(), **kwargs)
+                attempts.settle(getattr(response, "usage", None))
+                return response
+            except Exception as e:
+                delay = attempts.next_delay(e)
+                if delay is None:
+                    _stats.bump("failures")
+                    raise
+            finally:
+                _stats.bump("in_flight", -1)
+        time.sleep(delay)   # slot is released while backing off
+
+
+async def acall(fn, *args, deadline: float = None, retries: int = None, priority: int = INTERACTIVE,
+                timeout: float = None, **kwargs):
+    """Async counterpart of call() for async_client methods."""
+    attempts = _Attempts(fn, deadline, retries, priority, kwargs, timeout)
+    _stats.bump("calls")
+    while True:
+        await attempts.aadmit()
+        async with _async_slot():
+            _stats.bump("in_flight")
+            try:
+                response = await fn(*args, timeout=attempts.timeout(), **kwargs)
+                await attempts.asettle(getattr(response, "usage", None))
+                return response
+            except Exception as e:
+                delay = await attempts.anext_delay(e)
+                if delay is None:
+                    _stats.bump("failures")
+                    raise
+            finally:
+                _stats.bump("in_flight", -1)
+        await asyncio.sleep(delay)
+
+
+def chat(**kwargs):
+    return call(client.chat.completions.create, **kwargs)
+
+
+async def achat(**kwargs):
+    return await acall(async_client.chat.completions.create, **kwargs)
+
+
+def embed(**kwargs):
+    return call(client.embeddings.create, **kwargs)
+
+
+async def aembed(**kwargs):
+    return await acall(async_client.embeddings.create, **kwargs)
+
+
+async def astream(deadline: float = None, retries: int = None, priority: int = INTERACTIVE,
+                  timeout: float = None, **kwargs):
+    """
+    Streamed chat completion. Opening the stream is retried like any other
+    call; once chunks are flowing a failure is raised to the caller. The
+    concurrency slot is held until the stream is finished or closed.
+    """
+    attempts = _Attempts(async_client.chat.completions.create, deadline, retries, priority, kwargs, timeout)
+    _stats.bump("calls")
+    while True:
+        await attempts.aadmit()
+        slot = _async_slot()
+        await slot.acquire()
+        _stats.bump("in_flight")
+        try:
+            stream = await async_client.chat.completions.create(
+                stream=True, timeout=attempts.timeout(), **kwargs
+            )
+            break
+        except Exception as e:
+            _stats.bump("in_flight", -1)
+            slot.release()
+            delay = await attempts.anext_delay(e)
+            if delay is None:
+                _stats.bump("failures")
+                raise
+        await asyncio.sleep(delay)
+
+    try:
+        async for chunk in stream:
+            if getattr(chunk, "usage", None):
+                await attempts.asettle(chunk.usage)
+            yield chunk
+    finally:
+        _stats.bump("in_flight", -1)
+        slot.release()
+
+
+def stats() -> dict:
+    return {
+        **_stats.counts,
+        "rate_limits": limiter.stats(),
+        "concurrency_limit": LLM_CONCURRENCY,
+        "max_connections": LLM_MAX_CONNECTIONS,
+        "keepalive_connections": LLM_KEEPALIVE_CONNECTIONS,
+        "timeout": LLM_TIMEOUT,
+        "deadline": LLM_DEADLINE,
+        "max_retries": LLM_MAX_RETRIES,
+    }
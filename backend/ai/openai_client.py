@@ -1,74 +1,141 @@
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
+from ai import gateway
+from ai.context import build_context
+from ai.prompts import layout, record_usage, cached_tokens
 
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Token budgets for the retrieved-docs section of each prompt
+SUGGEST_CONTEXT_TOKENS = int(os.getenv("SUGGEST_CONTEXT_TOKENS", "1200"))
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "1500"))
 
-def ai_suggest(query, top_docs):
-    """
-    Generate AI-aided smart suggestions based on user query & retrieved documents
-    """
-    context = "\n\n".join([d["text"] for d in top_docs])
+SUGGEST_INSTRUCTIONS = """
+You are an AI immigration expert. The user ran a search on an immigration site.
 
-    prompt = f"""
-You are an AI immigration expert. The user searched: "{query}"
-
-Based on the documents below, generate:
+Based on the documents provided, generate:
 - Smart visa recommendations
 - Missing documents or eligibility hints
 - Similar visa programs they may want
 - Clear, short, helpful suggestions
 
-Documents:
-{context}
-
 Respond in JSON with:
-{{"suggestions": ["plain string 1", "plain string 2", ...], "summary": "..."}}
+{"suggestions": ["plain string 1", "plain string 2", ...], "summary": "..."}
 Each item in "suggestions" must be a plain string, not an object.
-    """
+"""
+
+def _suggest_messages(query, top_docs):
+    context = build_context(top_docs, budget=SUGGEST_CONTEXT_TOKENS)
+    return layout(
+        SUGGEST_INSTRUCTIONS,
+        user=f'The user searched: "{query}"',
+        context=f"Documents:\n{context}",
+    )
 
-    response = client.chat.completions.create(
+
+async def ai_suggest_async(query, top_docs):
+    """
+    Generate AI-aided smart suggestions based on user query & retrieved documents
+    """
+    response = await gateway.achat(
         model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}]
+        messages=_suggest_messages(query, top_docs)
     )
+    record_usage("ai_suggest", response.usage)
 
     return response.choices[0].message.content
 
 
-def ai_chat(message, top_docs, history=None):
+CHAT_INSTRUCTIONS = """You are Nika, a friendly AI immigration assistant. You have memory of the full conversation.
+
+- If the user greets you or asks something unrelated to visas/immigration, respond naturally and briefly.
+- If the user asks about visas, countries, eligibility, or immigration, answer using the context from the database that comes with their latest message. Do not invent information not in the context.
+- Keep answers concise and helpful.
+- If a follow-up question refers to something mentioned earlier in the conversation, use that context to give a coherent answer.
+"""
+
+def _chat_messages(message, top_docs, history=None, summary=None):
+    # Retrieved context changes every turn, so it goes after the history:
+    # instructions + summary + earlier turns stay a cacheable prefix.
+    context = build_context(top_docs, budget=CHAT_CONTEXT_TOKENS) if top_docs else ""
+    return layout(
+        CHAT_INSTRUCTIONS,
+        user=message,
+        reference=f"Summary of the earlier conversation:\n{summary}" if summary else "",
+        history=history,
+        context=f"Context from database:\n{context}" if context else "",
+    )
+
+
+async def ai_chat_async(message, top_docs, history=None, summary=None):
     """
     Conversational assistant with memory.
     - history: list of {"role": "user"|"assistant", "content": "..."} for prior turns
+    - summary: running summary of turns older than `history`
     - Uses RAG context only when the question is about immigration/visas.
     - Responds naturally to greetings and off-topic messages.
     """
-    context = "\n\n".join([d["text"] for d in top_docs]) if top_docs else ""
-
-    system = """You are Nika, a friendly AI immigration assistant. You have memory of the full conversation.
-
-- If the user greets you or asks something unrelated to visas/immigration, respond naturally and briefly.
-- If the user asks about visas, countries, eligibility, or immigration, answer using the context provided below. Do not invent information not in the context.
-- Keep answers concise and helpful.
-- If a follow-up question refers to something mentioned earlier in the conversation, use that context to give a coherent answer.
-
-Context from database:
-""" + context
+    response = await gateway.achat(
+        model="gpt-4o-mini",
+        messages=_chat_messages(message, top_docs, history, summary),
+    )
+    record_usage("ai_chat", response.usage)
 
-    messages = [{"role": "system", "content": system}]
+    return response.choices[0].message.content
 
-    # Inject prior turns so the model remembers the conversation
-    if history:
-        for turn in history:
-            messages.append({"role": turn["role"], "content": turn["content"]})
 
-    # Append the current user message
-    messages.append({"role": "user", "content": message})
+async def stream_completion(messages, model="gpt-4o-mini", endpoint="chat_stream"):
+    """
+    Stream a chat completion as it is generated.
+    Yields {"type": "token", "content": "..."} per delta, then one
+    {"type": "usage", "prompt_tokens": .., "cached_tokens": .., "completion_tokens": .., "total_tokens": ..}.
+    """
+    stream = gateway.astream(
+        model=model,
+        messages=messages,
+        stream_options={"include_usage": True},
+    )
 
-    response = client.chat.completions.create(
+    usage = None
+    async for chunk in stream:
+        if chunk.choices:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield {"type": "token", "content": delta}
+        if chunk.usage:
+            usage = chunk.usage
+    record_usage(endpoint, usage)
+
+    yield {
+        "type": "usage",
+        "prompt_tokens": usage.prompt_tokens if usage else None,
+        "cached_tokens": cached_tokens(usage) if usage else None,
+        "completion_tokens": usage.completion_tokens if usage else None,
+        "total_tokens": usage.total_tokens if usage else None,
+    }
+
+
+def ai_chat_stream(message, top_docs, history=None, summary=None):
+    """Streaming ai_chat_async — see stream_completion() for the events yielded."""
+    return stream_completion(_chat_messages(message, top_docs, history, summary), endpoint="ai_chat_stream")
+
+
+SUMMARY_INSTRUCTIONS = """Update the running summary of a conversation between a user and Nika, an immigration assistant.
+Keep facts about the user (goals, country, budget, education, family, timeline), questions asked and answers given.
+Be concise: at most 150 words. Write in the language the conversation uses.
+Return only the updated summary."""
+
+async def summarize_history(summary, turns):
+    """Fold `turns` into the running conversation `summary` (used by chat sessions)."""
+    transcript = "\n".join(f"{t['role']}: {t['content']}" for t in turns)
+    response = await gateway.achat(
+        priority=gateway.BATCH,   # runs after the reply, nobody is waiting on it
         model="gpt-4o-mini",
-        messages=messages,
+        messages=layout(
+            SUMMARY_INSTRUCTIONS,
+            user=f"Current summary:\n{summary or '(none)'}\n\nNew turns to fold in:\n{transcript}",
+        ),
     )
+    record_usage("summarize_history", response.usage)
 
-    return response.choices[0].message.content
+    return response.choices[0].message.content.strip()
@@ -0,0 +1,70 @@
+"""
+Prompt layout + prompt-cache accounting.
+
+OpenAI caches prompt prefixes (in 128-token steps once a prompt passes 1024
+tokens): a request that starts with the same tokens as a recent one skips
+prefill for that part. Only an identical *prefix* counts, so every prompt is
+laid out from most static to most dynamic:
+
+  1. instructions   — fixed per endpoint (role, rules, output format)
+  2. reference      — changes rarely (conversation summary, list of posts)
+  3. history        — append-only, so turn N is a prefix of turn N+1
+  4. context        — per request (retrieved documents)
+  5. user           — per request (query, profile, message)
+
+record_usage() logs the cached-token count the API reports for each call and
+keeps per-endpoint totals for the stats endpoints.
+"""
+
+import threading
+
+
+def layout(instructions: str, user: str, reference: str = "", history=None, context: str = "") -> list:
+    """Chat messages ordered static → dynamic (see module docstring)."""
+    messages = [{"role": "system", "content": instructions.strip()}]
+    if reference:
+        messages.append({"role": "system", "content": reference.strip()})
+    for turn in history or []:
+        messages.append({"role": turn["role"], "content": turn["content"]})
+    if context:
+        messages.append({"role": "system", "content": context.strip()})
+    messages.append({"role": "user", "content": user.strip()})
+    return messages
+
+
+# ── cached-token accounting ─────────────────────────────────────────────────
+
+_lock = threading.Lock()
+_totals = {}   # endpoint -> {"calls", "prompt_tokens", "cached_tokens"}
+
+
+def cached_tokens(usage) -> int:
+    details = getattr(usage, "prompt_tokens_details", None) if usage else None
+    return (getattr(details, "cached_tokens", None) or 0) if details else 0
+
+
+def record_usage(endpoint: str, usage) -> None:
+    """Log and accumulate prompt / cached token counts of one completion."""
+    if usage is None:
+        return
+    prompt = usage.prompt_tokens or 0
+    cached = cached_tokens(usage)
+    with _lock:
+        totals = _totals.setdefault(endpoint, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0})
+        totals["calls"] += 1
+        totals["prompt_tokens"] += prompt
+        totals["cached_tokens"] += cached
+    share = f"{cached / prompt:.0%}" if prompt else "-"
+    print(f"[prompt-cache] {endpoint}: {prompt} prompt tokens, {cached} cached ({share})")
+
+
+def prompt_cache_stats() -> dict:
+    with _lock:
+        return {
+            endpoint: {
+                **totals,
+                "cached_ratio": round(totals["cached_tokens"] / totals["prompt_tokens"], 4)
+                if totals["prompt_tokens"] else 0.0,
+            }
+            for endpoint, totals in _totals.items()
+        }
@@ -0,0 +1,356 @@
+"""
+Outbound rate limiting for the LLM gateway.
+
+Each model has two token buckets, requests/min and tokens/min, so we stay
+under the account's limits instead of finding them through 429s. Callers
+queue per model in priority order:
+
+  INTERACTIVE  user-facing requests (search, chat, assessment)
+  BATCH        background work (index builds, blog generation, linking,
+               history compaction)
+
+A queued interactive request always goes ahead of queued batch work. While
+interactive traffic is active on a model (a request queued or granted in
+the last INTERACTIVE_WINDOW seconds), batch work may only drain a bucket
+down to BATCH_RESERVE of its capacity, so the next interactive request finds
+room immediately. Without interactive traffic batch work gets the whole
+bucket, and a waiting batch call re-checks on every refill.
+
+A 429 pauses the whole model for its Retry-After. The token cost of a call is
+estimated up front and corrected with the real usage afterwards (settle());
+an attempt that fails gives its estimate back.
+
+Limits come from RATE_LIMITS="model=rpm:tpm,..." (tpm 0 = requests only),
+e.g. RATE_LIMITS="gpt-4o-mini=500:200000,text-embedding-3-small=3000:1000000".
+Unset, DEFAULT_LIMITS applies (OpenAI's tier-1 limits for the models this app
+calls, so priorities work out of the box); set RATE_LIMITS to the account's
+real tier, or to "" to turn local limiting off. Models without an entry are
+not limited.
+
+Bucket levels, 429 pauses and interactive activity live in a small SQLite
+table (RATE_LIMIT_DB), so every process on the box — uvicorn workers, the
+bot, an index build or ingest job — draws from the same budget, and batch
+work in one process keeps the reserve for interactive traffic in another.
+The queue order itself is per process. With RATE_LIMIT_DB="" each process
+enforces the limits on its own, and the account sees up to N times them.
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import contextlib
+
+from utils.sqlite import connect
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+BATCH_RESERVE = float(os.getenv("RATE_LIMIT_BATCH_RESERVE", "0.2"))
+INTERACTIVE_WINDOW = float(os.getenv("RATE_LIMIT_INTERACTIVE_WINDOW", "2"))   # seconds
+POLL_INTERVAL = 0.05   # seconds; re-check interval for waiters not at the head
+
+DEFAULT_LIMITS = "gpt-4o=500:30000,gpt-4o-mini=500:200000,text-embedding-3-small=3000:1000000"
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", os.path.join(BASE_DIR, "rag", "ratelimit.db"))
+
+
+def parse_limits(text: str) -> dict:
+    """Parse "model=rpm:tpm,..." into {model: (rpm, tpm)}."""
+    limits = {}
+    for item in filter(None, (p.strip() for p in (text or "").split(","))):
+        model, _, values = item.partition("=")
+        rpm, _, tpm = values.partition(":")
+        limits[model.strip()] = (int(rpm), int(tpm or 0))
+    return limits
+
+
+class TokenBucket:
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.time()   # wall clock: levels are shared between processes
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, reserve: float = 0.0) -> float:
+        """Seconds until `amount` can be taken leaving `reserve` (fraction of capacity) behind."""
+        # A request larger than the bucket waits for a full bucket, then goes into debt
+        target = min(amount + reserve * self.capacity, self.capacity)
+        return max(0.0, (target - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+    def refund(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+class ModelLimiter:
+    def __init__(self, model: str, rpm: int, tpm: int):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.blocked_until = 0.0
+        self.penalties = 0
+        self.waiters = []   # heap of (priority, seq)
+        self.interactive_at = 0.0   # last time an interactive request was queued or granted
+
+    def refill(self, now: float) -> None:
+        self.requests.refill(now)
+        if self.tokens is not None:
+            self.tokens.refill(now)
+
+    def wait_time(self, priority: int, cost: int) -> float:
+        """0 if the head of the queue may go now, else roughly how long to wait."""
+        now = time.time()
+        self.refill(now)
+        wait = max(self.blocked_until - now, self._bucket_wait(cost, 0.0))
+        if priority == INTERACTIVE or wait > 0:
+            return wait
+
+        # Batch work keeps a reserve only while interactive traffic is active
+        quiet_in = self.interactive_at + INTERACTIVE_WINDOW - now
+        if quiet_in <= 0:
+            return 0.0
+        reserved = self._bucket_wait(cost, BATCH_RESERVE)
+        if reserved <= 0:
+            return 0.0
+        # Re-check on the next refill or when the interactive window closes,
+        # whichever comes first, instead of sleeping until the reserve is back
+        return min(reserved, quiet_in, 1.0 / self.requests.rate)
+
+    def _bucket_wait(self, cost: int, reserve: float) -> float:
+        wait = self.requests.wait_time(1, reserve)
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(cost, reserve))
+        return wait
+
+    def take(self, cost: int) -> None:
+        self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(cost)
+
+
+class SharedState:
+    """Per-model limiter state in SQLite, read and written back in one transaction."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = connect(path, (
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            "  model          TEXT PRIMARY KEY,"
+            "  requests       REAL NOT NULL,"
+            "  tokens         REAL,"
+            "  updated        REAL NOT NULL,"
+            "  blocked_until  REAL NOT NULL,"
+            "  interactive_at REAL NOT NULL"
+            ")",
+        ))
+
+    @contextlib.contextmanager
+    def sync(self, limiter: ModelLimiter):
+        """Load `limiter` from the table, let the caller use it, store it back."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT requests, tokens, updated, blocked_until, interactive_at "
+                    "FROM rate_limits WHERE model = ?", (limiter.model,)
+                ).fetchone()
+                if row is not None:
+                    requests, tokens, updated, blocked_until, interactive_at = row
+                    limiter.requests.level = min(requests, limiter.requests.capacity)
+                    limiter.requests.updated = updated
+                    if limiter.tokens is not None and tokens is not None:
+                        limiter.tokens.level = min(tokens, limiter.tokens.capacity)
+                        limiter.tokens.updated = updated
+                    # Pauses and activity recorded here since the last sync count too
+                    limiter.blocked_until = max(limiter.blocked_until, blocked_until)
+                    limiter.interactive_at = max(limiter.interactive_at, interactive_at)
+                limiter.refill(time.time())
+                yield
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_limits "
+                    "(model, requests, tokens, updated, blocked_until, interactive_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (limiter.model, limiter.requests.level,
+                     limiter.tokens.level if limiter.tokens is not None else None,
+                     limiter.requests.updated, limiter.blocked_until, limiter.interactive_at),
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+
+class RateLimiter:
+    def __init__(self, limits: dict, db_path: str = None):
+        self._models = {model: ModelLimiter(model, rpm, tpm) for model, (rpm, tpm) in limits.items()}
+        self._shared = SharedState(db_path) if db_path and self._models else None
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._metrics = {
+            name: {"waiting": 0, "max_waiting": 0, "granted": 0, "timeouts": 0,
+                   "wait_total": 0.0, "wait_max": 0.0}
+            for name in PRIORITY_NAMES.values()
+        }
+
+    # ── queue bookkeeping (caller holds self._cond) ────────────────────────
+
+    def _enqueue(self, limiter: ModelLimiter, priority: int):
+        ticket = (priority, next(self._seq))
+        heapq.heappush(limiter.waiters, ticket)
+        if priority == INTERACTIVE:
+            limiter.interactive_at = time.time()
+        m = self._metrics[PRIORITY_NAMES[priority]]
+        m["waiting"] += 1
+        m["max_waiting"] = max(m["max_waiting"], m["waiting"])
+        return ticket
+
+    def _dequeue(self, limiter: ModelLimiter, ticket, waited: float, granted: bool) -> None:
+        limiter.waiters.remove(ticket)
+        heapq.heapify(limiter.waiters)
+        m = self._metrics[PRIORITY_NAMES[ticket[0]]]
+        m["waiting"] -= 1
+        if granted:
+            m["granted"] += 1
+            m["wait_total"] += waited
+            m["wait_max"] = max(m["wait_max"], waited)
+        else:
+            m["timeouts"] += 1
+        self._cond.notify_all()
+
+    def _sync(self, limiter: ModelLimiter):
+        return self._shared.sync(limiter) if self._shared is not None else contextlib.nullcontext()
+
+    def _poll(self, limiter, ticket, cost, started, timeout):
+        """Take capacity if `ticket` may go. Returns (granted, seconds to wait)."""
+        wait = POLL_INTERVAL
+        if limiter.waiters[0] == ticket:
+            with self._sync(limiter):
+                wait = limiter.wait_time(ticket[0], cost)
+                if wait <= 0:
+                    limiter.take(cost)
+                    if ticket[0] == INTERACTIVE:
+                        limiter.interactive_at = time.time()
+        waited = time.monotonic() - started
+        if wait <= 0:
+            self._dequeue(limiter, ticket, waited, True)
+            return True, 0.0
+        if timeout is not None and waited + min(wait, POLL_INTERVAL) > timeout:
+            self._dequeue(limiter, ticket, waited, False)
+            return False, 0.0
+        return None, wait
+
+    def _locked_poll(self, *args):
+        with self._cond:
+            return self._poll(*args)
+
+    # ── public API ──────────────────────────────────────────────────────────
+
+    def acquire(self, model: str, cost: int, priority: int = INTERACTIVE, timeout: float = None) -> bool:
+        """Block until `model` has room for one request of `cost` tokens. False on timeout."""
+        limiter = self._models.get(model)
+        if limiter is None:
+            return True
+        started = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue(limiter, priority)
+            while True:
+                granted, wait = self._poll(limiter, ticket, cost, started, timeout)
+                if granted is not None:
+                    return granted
+                # Other processes don't notify us: re-check shared state regularly
+                self._cond.wait(wait if self._shared is None else min(wait, POLL_INTERVAL))
+
+    async def aacquire(self, model: str, cost: int, priority: int = INTERACTIVE, timeout: float = None) -> bool:
+        """acquire() for coroutines: sleeps on the event loop instead of blocking it."""
+        limiter = self._models.get(model)
+        if limiter is None:
+            return True
+        started = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue(limiter, priority)
+        try:
+            while True:
+                with self._cond:
+                    # The head's poll is a SQLite transaction with shared state:
+                    # that one runs in a thread, off the event loop
+                    offload = self._shared is not None and limiter.waiters[0] == ticket
+                    if not offload:
+                        granted, wait = self._poll(limiter, ticket, cost, started, timeout)
+                if offload:
+                    granted, wait = await asyncio.to_thread(
+                        self._locked_poll, limiter, ticket, cost, started, timeout
+                    )
+                if granted is not None:
+                    return granted
+                await asyncio.sleep(min(wait, POLL_INTERVAL))
+        except asyncio.CancelledError:
+            with self._cond:
+                if ticket in limiter.waiters:
+                    self._dequeue(limiter, ticket, time.monotonic() - started, False)
+            raise
+
+    def settle(self, model: str, estimated: int, actual) -> None:
+        """Correct the tokens/min bucket once the real usage is known (0 for a failed call)."""
+        limiter = self._models.get(model)
+        if limiter is None or limiter.tokens is None or actual is None:
+            return
+        with self._cond, self._sync(limiter):
+            if actual < estimated:
+                limiter.tokens.refund(estimated - actual)
+            else:
+                limiter.tokens.take(actual - estimated)
+
+    def penalize(self, model: str, seconds: float) -> None:
+        """The API returned 429: hold every request for `model` for `seconds`."""
+        limiter = self._models.get(model)
+        if limiter is None:
+            return
+        with self._cond, self._sync(limiter):
+            limiter.blocked_until = max(limiter.blocked_until, time.time() + seconds)
+            limiter.penalties += 1
+
+    async def offload(self, fn, *args):
+        """Run a limiter call from a coroutine; with shared state it is SQLite work, so in a thread."""
+        if self._shared is None:
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    def stats(self) -> dict:
+        with self._cond:
+            models = {}
+            for model, limiter in self._models.items():
+                with self._sync(limiter):
+                    limiter.refill(time.time())
+                now = time.time()
+                models[model] = {
+                    "rpm": int(limiter.requests.capacity),
+                    "tpm": int(limiter.tokens.capacity) if limiter.tokens else None,
+                    "requests_available": round(limiter.requests.level, 1),
+                    "tokens_available": round(limiter.tokens.level) if limiter.tokens else None,
+                    "queued": len(limiter.waiters),
+                    "penalties": limiter.penalties,
+                    "paused_for": round(max(0.0, limiter.blocked_until - now), 2),
+                }
+            priorities = {
+                name: {
+                    **{k: v for k, v in m.items() if k != "wait_total"},
+                    "wait_max": round(m["wait_max"], 3),
+                    "wait_avg": round(m["wait_total"] / m["granted"], 3) if m["granted"] else 0.0,
+                }
+                for name, m in self._metrics.items()
+            }
+        return {"models": models, "priorities": priorities, "shared": self._shared is not None}
+
+
+limiter = RateLimiter(parse_limits(os.getenv("RATE_LIMITS", DEFAULT_LIMITS)), RATE_LIMIT_DB or None)
@@ -7,17 +7,59 @@ import json
 import httpx
 from datetime import datetime
 from slugify import slugify
-from openai import OpenAI
 from dotenv import load_dotenv
 from linker import add_internal_links
+from ai import gateway
+from ai.prompts import layout, record_usage
 
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 BASE_DIR = os.path.dirname(__file__)
 IMAGE_DIR = os.path.join(BASE_DIR, "data", "blog", "images")
 
+# A ~1500-word JSON article from gpt-4o can take minutes; every timed-out
+# attempt is billed, so give one attempt plenty of room instead of retrying
+GENERATE_TIMEOUT = float(os.getenv("GENERATE_TIMEOUT", "300"))
+IMAGE_TIMEOUT    = float(os.getenv("IMAGE_TIMEOUT", "180"))
+
+# Everything that doesn't depend on the topic lives here, ahead of the
+# per-post specification, so it forms a prompt-cacheable prefix.
+SYSTEM_PROMPT = """You are an expert Persian immigration content writer for nikavisa.com.
+Your writing is accurate, helpful, and trustworthy — written for Iranian audiences considering immigration.
+You write in fluent, natural Persian (Farsi). Never use machine-translated or stiff language.
+You always structure articles clearly with proper H2/H3 headings.
+You never make up visa requirements or legal facts — if unsure, say "consult an immigration advisor".
+
+Every article targets approximately 1500 words with at least 5-6 main sections.
+
+Return ONLY a valid JSON object (no markdown, no backticks) with this exact structure:
+{
+  "title": "<Persian title, SEO optimized>",
+  "slug": "<english-slug-based-on-title>",
+  "meta_description": "<Persian meta description, 150-160 chars>",
+  "category": "<the CATEGORY given in the specification>",
+  "tags": ["<tag1>", "<tag2>", "<tag3>"],
+  "outline": [
+    {"id": "section-1", "text": "<heading text>"},
+    {"id": "section-2", "text": "<heading text>"},
+    {"id": "section-3", "text": "<heading text>"},
+    {"id": "section-4", "text": "<heading text>"},
+    {"id": "section-5", "text": "<heading text>"},
+    {"id": "section-6", "text": "<heading text>"}
+  ],
+  "content_html": "<full article as HTML with h2, h3, p, ul, li tags in Persian>",
+  "image_prompt": "<english description of an ideal clean minimal illustration for this article header>"
+}
+
+Rules for content_html:
+- Use <h2> for main sections, <h3> for subsections
+- Use <p> for paragraphs, <ul><li> for lists
+- Add id attributes to h2 tags matching outline (e.g. <h2 id="section-1">)
+- Do NOT include <html>, <head>, <body> tags
+- Do NOT include the title as H1
+- Write at least 5-6 substantial sections with multiple paragraphs each
+"""
+
 
 def generate_blog_post(
     topic: str,
@@ -36,59 +78,25 @@ Additional context to incorporate (use for accuracy — do not ignore):
 ---
 """ if extra_context else ""
 
-    system_prompt = """You are an expert Persian immigration content writer for nikavisa.com.
-Your writing is accurate, helpful, and trustworthy — written for Iranian audiences considering immigration.
-You write in fluent, natural Persian (Farsi). Never use machine-translated or stiff language.
-You always structure articles clearly with proper H2/H3 headings.
-You never make up visa requirements or legal facts — if unsure, say "consult an immigration advisor".
-"""
-
     user_prompt = f"""Write a complete Persian blog post with the following specifications:
 
 TOPIC: {topic}
 CATEGORY: {category}
 TONE: {tone}
-TARGET LENGTH: approximately 1500 words with at least 5-6 main sections
 {keyword_instruction}
 {context_instruction}
-
-Return ONLY a valid JSON object (no markdown, no backticks) with this exact structure:
-{{
-  "title": "<Persian title, SEO optimized>",
-  "slug": "<english-slug-based-on-title>",
-  "meta_description": "<Persian meta description, 150-160 chars>",
-  "category": "{category}",
-  "tags": ["<tag1>", "<tag2>", "<tag3>"],
-  "outline": [
-    {{"id": "section-1", "text": "<heading text>"}},
-    {{"id": "section-2", "text": "<heading text>"}},
-    {{"id": "section-3", "text": "<heading text>"}},
-    {{"id": "section-4", "text": "<heading text>"}},
-    {{"id": "section-5", "text": "<heading text>"}},
-    {{"id": "section-6", "text": "<heading text>"}}
-  ],
-  "content_html": "<full article as HTML with h2, h3, p, ul, li tags in Persian>",
-  "image_prompt": "<english description of an ideal clean minimal illustration for this article header>"
-}}
-
-Rules for content_html:
-- Use <h2> for main sections, <h3> for subsections
-- Use <p> for paragraphs, <ul><li> for lists
-- Add id attributes to h2 tags matching outline (e.g. <h2 id="section-1">)
-- Do NOT include <html>, <head>, <body> tags
-- Do NOT include the title as H1
-- Write at least 5-6 substantial sections with multiple paragraphs each
 """
 
-    response = client.chat.completions.create(
+    response = gateway.chat(
+        priority=gateway.BATCH,
+        timeout=GENERATE_TIMEOUT,
+        deadline=GENERATE_TIMEOUT * 2,
         model="gpt-4o",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
+        messages=layout(SYSTEM_PROMPT, user=user_prompt),
         response_format={"type": "json_object"},
         temperature=0.7,
     )
+    record_usage("generate_blog_post", response.usage)
 
     raw = json.loads(response.choices[0].message.content)
     slug = slugify(raw.get("slug", topic))
@@ -129,7 +137,11 @@ def generate_blog_image(slug: str, image_prompt: str) -> str | None:
     )
 
     try:
-        response = client.images.generate(
+        response = gateway.call(
+            gateway.client.images.generate,
+            timeout=IMAGE_TIMEOUT,
+            deadline=IMAGE_TIMEOUT * 2,
+            priority=gateway.BATCH,
             model="dall-e-3",
             prompt=full_prompt,
             size="1792x1024",
@@ -218,7 +218,7 @@ def main():
     print("\nRebuilding FAISS index...")
     from rag.build_index import build
     build()
-    print("Done. Restart the backend to load the new data.\n")
+    print("Done. Running backends hot-reload the new index version automatically.\n")
 
 
 if __name__ == "__main__":
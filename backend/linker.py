@@ -7,49 +7,55 @@ Used by generator.py pipeline.
 import os
 import json
 import re
-from openai import OpenAI
 from dotenv import load_dotenv
+from ai import gateway
+from ai.prompts import layout, record_usage
+from services.blog_store import get_store
 
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-BASE_DIR = os.path.dirname(__file__)
-BLOG_DIR = os.path.join(BASE_DIR, "data", "blog")
 SITE_URL = os.getenv("SITE_URL", "https://nikavisa.com")
 
+LINKER_INSTRUCTIONS = """You are an SEO internal linking expert.
+
+You get a list of EXISTING POSTS and a NEW ARTICLE.
+Task: Select the most relevant existing posts to link to from the new article.
+For each, suggest a natural Persian anchor text phrase that would appear in the new article.
+
+Return ONLY valid JSON array (no markdown):
+[
+  {"slug": "existing-slug", "anchor_text": "متن لینک به فارسی", "reason": "why this is relevant"},
+  ...
+]
+
+Rules:
+- Only pick genuinely relevant posts (same topic, related visa type, or complementary info)
+- Anchor text must be a natural Persian phrase that would fit in the article
+- Never force irrelevant links
+"""
+
 
 # ============================================================
 # STEP 1: Load all existing posts (title, tags, slug, excerpt)
 # ============================================================
 def load_existing_posts(lang: str = "fa", exclude_slug: str = "") -> list:
     posts = []
-    if not os.path.exists(BLOG_DIR):
-        return posts
-
-    for item in os.listdir(BLOG_DIR):
-        if item == exclude_slug:
+    # Ordered by slug: a stable order keeps the linker prompt cacheable
+    for slug, _, data, _, _ in get_store().posts(lang):
+        if slug == exclude_slug:
             continue
-        item_path = os.path.join(BLOG_DIR, item)
-        if not os.path.isdir(item_path):
-            continue
-        post_path = os.path.join(item_path, f"{lang}.json")
-        if not os.path.exists(post_path):
-            continue
-        with open(post_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
 
         # Extract first 100 chars of plain text as excerpt
         content = data.get("content_html", "")
         excerpt = re.sub(r"<[^>]+>", "", content)[:150].strip()
 
         posts.append({
-            "slug": item,
+            "slug": slug,
             "title": data.get("title", ""),
             "tags": data.get("tags", []),
             "category": data.get("category", ""),
             "excerpt": excerpt,
-            "url": f"{SITE_URL}/blog/{item}",
+            "url": f"{SITE_URL}/blog/{slug}",
         })
 
     return posts
@@ -67,38 +73,31 @@ def find_relevant_links(new_post_title: str, new_post_content: str, existing_pos
         for p in existing_posts
     ])
 
-    prompt = f"""You are an SEO internal linking expert.
-
-NEW ARTICLE:
+    new_article = f"""NEW ARTICLE:
 Title: {new_post_title}
 Content preview: {re.sub(r'<[^>]+>', '', new_post_content)[:500]}
 
-EXISTING POSTS:
-{posts_summary}
-
-Task: Select the {max_links} most relevant existing posts to link to from the new article.
-For each, suggest a natural Persian anchor text phrase that would appear in the new article.
-
-Return ONLY valid JSON array (no markdown):
-[
-  {{"slug": "existing-slug", "anchor_text": "متن لینک به فارسی", "reason": "why this is relevant"}},
-  ...
-]
-
-Rules:
-- Only pick genuinely relevant posts (same topic, related visa type, or complementary info)
-- Anchor text must be a natural Persian phrase that would fit in the article
-- If fewer than {max_links} posts are relevant, return only the relevant ones
-- Never force irrelevant links
+Select the {max_links} most relevant existing posts to link to from this article.
+If fewer than {max_links} posts are relevant, return only the relevant ones.
 """
 
     try:
-        response = client.chat.completions.create(
+        response = gateway.chat(
+            priority=gateway.BATCH,
+            timeout=120,   # gpt-4o over the whole post list; slower than interactive calls
+            deadline=240,
             model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
+            # The post list only changes when a post is published, so it sits
+            # between the fixed instructions and the new article
+            messages=layout(
+                LINKER_INSTRUCTIONS,
+                user=new_article,
+                reference=f"EXISTING POSTS:\n{posts_summary}",
+            ),
             response_format={"type": "json_object"},
             temperature=0.3,
         )
+        record_usage("find_relevant_links", response.usage)
         raw = json.loads(response.choices[0].message.content)
         # GPT might return {"links": [...]} or just [...]
         if isinstance(raw, list):
@@ -1,14 +1,24 @@
 import os
 import json
+import hashlib
 import traceback
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from openai import OpenAI
+
+from ai import gateway
+from ai.openai_client import stream_completion
+from ai.prompts import layout, record_usage, prompt_cache_stats
+from utils.sse import SSE_HEADERS, sse_chat_stream
+from utils.singleflight import SingleFlight
+from utils.cache import TTLCache
+from routers.blog import verify_bot_secret
+from services.eligibility import EligibilityScorer, shortlist_context, fast_assessment
 
 # ============================================================
 # INIT APP
@@ -38,10 +48,10 @@ app.add_middleware(
 )
 
 # ============================================================
-# OPENAI CLIENT
+# OPENAI
 # ============================================================
+# Calls go through the shared pooled clients in ai/gateway.py
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
-client = OpenAI(api_key=OPENAI_API_KEY)
 
 # ============================================================
 # PATHS + STATIC FILES
@@ -73,6 +83,9 @@ except Exception as e:
     print("[WARN] Failed to load visa_programs.json:", str(e))
     print(traceback.format_exc())
 
+# Requirements compiled to NumPy arrays; scores a profile against every program in one pass
+eligibility = EligibilityScorer(VISA_PROGRAMS if isinstance(VISA_PROGRAMS, list) else [])
+
 # ============================================================
 # MODELS
 # ============================================================
@@ -88,6 +101,11 @@ class AssessmentInput(BaseModel):
     contact: Dict[str, Any] = {}
 
 
+class AssessmentBatch(BaseModel):
+    profiles: List[AssessmentInput]
+    top_k: int = 3
+
+
 class ChatInput(BaseModel):
     message: str
 
@@ -107,17 +125,57 @@ def health():
 # ============================================================
 # ASSESSMENT ENDPOINT
 # ============================================================
-@app.post("/api/assess")
-async def assess(input: AssessmentInput):
-    try:
-        if not OPENAI_API_KEY:
-            raise RuntimeError("OPENAI_API_KEY is missing in Railway variables")
+# Identical profiles submitted at the same time share one LLM call
+assess_flight = SingleFlight("assess")
+
+ASSESS_MODEL = "gpt-4o-mini"
+# Deterministic mode: temperature 0 + fixed seed, so a stored evaluation is
+# what the model would answer again and can be served from the cache.
+# With it off, every submission gets a fresh (sampled) evaluation.
+ASSESS_DETERMINISTIC = os.getenv("ASSESS_DETERMINISTIC", "1") not in ("0", "false", "no")
+ASSESS_SEED = 7
+assess_cache = TTLCache(
+    ttl=float(os.getenv("ASSESS_CACHE_TTL", str(24 * 3600))),
+    maxsize=int(os.getenv("ASSESS_CACHE_SIZE", "2048")),
+)
+
 
-        deep = "\n".join(f"  {k}: {v}" for k, v in (input.deep_dive or {}).items()) or "  N/A"
+def assessment_key(input: AssessmentInput) -> str:
+    """Canonical form of everything the prompt sees (contact is excluded)."""
+    profile = input.model_dump(exclude={"contact"})
+    profile["deep_dive"] = dict(sorted((input.deep_dive or {}).items()))
+    return json.dumps(profile, sort_keys=True, ensure_ascii=False, default=str)
 
-        prompt = f"""
-You are Nika Visa AI. Evaluate this applicant's immigration eligibility and provide a detailed assessment.
 
+ASSESS_INSTRUCTIONS = """
+You are Nika Visa AI. Evaluate the applicant's immigration eligibility and provide a detailed assessment.
+The applicant's profile and pathway-specific details follow, together with candidate
+programs pre-scored by our eligibility rules. Prefer recommending one of those candidates
+when it fits the profile, and use their listed gaps when describing risks.
+
+Return ONLY valid JSON (no markdown):
+{
+  "score": <integer 0-100>,
+  "visa": "<recommended visa name>",
+  "summary": "<2-3 sentence personalized evaluation>",
+  "missing_docs": ["<doc1>", "<doc2>"],
+  "risks": ["<risk1>", "<risk2>"],
+  "steps": ["<step1>", "<step2>", "<step3>"]
+}
+"""
+
+
+# Part of the cache key: editing the prompt or model invalidates old entries
+ASSESS_PROMPT_VERSION = hashlib.sha1(
+    f"{ASSESS_MODEL}\x00{ASSESS_INSTRUCTIONS}\x00{json.dumps(VISA_PROGRAMS, sort_keys=True)}".encode("utf-8")
+).hexdigest()[:12]
+ASSESS_SHORTLIST = 3   # locally pre-scored programs passed to the LLM
+
+
+async def evaluate_profile(input: AssessmentInput) -> dict:
+    deep = "\n".join(f"  {k}: {v}" for k, v in sorted((input.deep_dive or {}).items())) or "  N/A"
+
+    profile = f"""
 PROFILE:
   Goal: {input.goal}
   Age range: {input.age_range}
@@ -130,25 +188,42 @@ PROFILE:
 PATHWAY-SPECIFIC DETAILS:
 {deep}
 
-Return ONLY valid JSON (no markdown):
-{{
-  "score": <integer 0-100>,
-  "visa": "<recommended visa name>",
-  "summary": "<2-3 sentence personalized evaluation>",
-  "missing_docs": ["<doc1>", "<doc2>"],
-  "risks": ["<risk1>", "<risk2>"],
-  "steps": ["<step1>", "<step2>", "<step3>"]
-}}
+{shortlist_context(eligibility.shortlist([input.model_dump()], ASSESS_SHORTLIST)[0])}
 """
 
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"},
-        )
+    sampling = {"temperature": 0, "seed": ASSESS_SEED} if ASSESS_DETERMINISTIC else {}
+    response = await gateway.achat(
+        model=ASSESS_MODEL,
+        messages=layout(ASSESS_INSTRUCTIONS, user=profile),
+        response_format={"type": "json_object"},
+        **sampling,
+    )
+    record_usage("assess", response.usage)
 
-        content = response.choices[0].message.content
-        return json.loads(content)
+    content = response.choices[0].message.content
+    return json.loads(content)
+
+
+@app.post("/api/assess")
+async def assess(input: AssessmentInput, fast: bool = False):
+    """fast=true skips the LLM and answers from the local pre-scorer."""
+    if fast:
+        return fast_assessment(eligibility.shortlist([input.model_dump()], ASSESS_SHORTLIST)[0])
+
+    try:
+        if not OPENAI_API_KEY:
+            raise RuntimeError("OPENAI_API_KEY is missing in Railway variables")
+
+        key = assessment_key(input)
+        if not ASSESS_DETERMINISTIC:
+            return await assess_flight.do(key, evaluate_profile, input)
+
+        cache_key = f"{ASSESS_PROMPT_VERSION}:{key}"
+        result = assess_cache.get(cache_key)
+        if result is None:
+            result = await assess_flight.do(key, evaluate_profile, input)
+            assess_cache.set(cache_key, result)
+        return result
 
     except Exception as e:
         print("=== /api/assess ERROR ===")
@@ -157,25 +232,45 @@ Return ONLY valid JSON (no markdown):
         raise HTTPException(status_code=500, detail="Assessment failed")
 
 
+@app.post("/api/assess/batch")
+def assess_batch(batch: AssessmentBatch, _: bool = Depends(verify_bot_secret)):
+    """Score many profiles (e.g. CRM leads) locally in one vectorized pass."""
+    profiles = [p.model_dump(exclude={"contact"}) for p in batch.profiles]
+    return {"results": eligibility.shortlist(profiles, max(1, batch.top_k))}
+
+
+@app.get("/api/assess/stats")
+def assess_stats():
+    return {
+        "deterministic": ASSESS_DETERMINISTIC,
+        "cache": assess_cache.stats(),
+        "single_flight": assess_flight.stats(),
+        "prompt_cache": prompt_cache_stats(),
+        "llm_gateway": gateway.stats(),
+    }
+
+
 # ============================================================
 # CHAT ENDPOINT
 # ============================================================
+CHAT_INSTRUCTIONS = "You are Nika Visa AI, an immigration assistant. Reply helpfully and concisely."
+
+
+def chat_messages(message: str):
+    return layout(CHAT_INSTRUCTIONS, user=message)
+
+
 @app.post("/api/chat")
 async def chat(input: ChatInput):
     try:
         if not OPENAI_API_KEY:
             raise RuntimeError("OPENAI_API_KEY is missing in Railway variables")
 
-        prompt = (
-            "You are Nika Visa AI, an immigration assistant. "
-            "Reply helpfully and concisely.\n\n"
-            f"User: {input.message}"
-        )
-
-        response = client.chat.completions.create(
+        response = await gateway.achat(
             model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
+            messages=chat_messages(input.message),
         )
+        record_usage("chat", response.usage)
 
         reply = response.choices[0].message.content
         return {"reply": reply}
@@ -187,6 +282,20 @@ async def chat(input: ChatInput):
         raise HTTPException(status_code=500, detail="Chat failed")
 
 
+@app.post("/api/chat/stream")
+async def chat_stream(input: ChatInput):
+    """Same as /api/chat, but tokens are sent as Server-Sent Events as they arrive."""
+    if not OPENAI_API_KEY:
+        raise HTTPException(status_code=500, detail="Chat failed")
+
+    events = stream_completion(chat_messages(input.message), endpoint="chat_stream")
+    return StreamingResponse(
+        sse_chat_stream(events),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
 # ============================================================
 # ROUTERS
 # ============================================================
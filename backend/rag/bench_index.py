@@ -0,0 +1,96 @@
+"""
+ANN Index Benchmark
+===================
+Compares index specs against the exact flat baseline on synthetic corpora:
+recall@k plus p50/p99 single-query latency and build time.
+
+The corpus is a Gaussian mixture of unit vectors (embeddings cluster by
+topic, so uniform noise would flatter IVF and understate HNSW).
+
+Usage (from backend/):
+    python -m rag.bench_index
+    python -m rag.bench_index --sizes 10000,100000,1000000 --dim 1536 \\
+        --specs "hnsw:M=32,efSearch=64" "ivf:nlist=4096,nprobe=32"
+"""
+
+import time
+import argparse
+import numpy as np
+import faiss
+
+from rag.index_spec import parse_spec, spec_to_str, create_index
+
+DEFAULT_SPECS = [
+    "hnsw:M=32,efSearch=64",
+    "hnsw:M=32,efSearch=128",
+    "ivf:nlist=1024,nprobe=16",
+    "ivfpq:nlist=1024,m=16,nbits=8,nprobe=16",
+]
+
+
+def synthetic_corpus(n: int, dim: int, clusters: int = 256, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    labels = rng.integers(0, clusters, size=n)
+    vectors = centers[labels] + 0.35 * rng.standard_normal((n, dim)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def measure(index, queries, k):
+    """Return (ids, p50_ms, p99_ms) querying one vector at a time."""
+    ids = np.empty((len(queries), k), dtype="int64")
+    timings = np.empty(len(queries))
+    for i, q in enumerate(queries):
+        start = time.perf_counter()
+        _, found = index.search(q[None, :], k)
+        timings[i] = (time.perf_counter() - start) * 1000
+        ids[i] = found[0]
+    return ids, float(np.percentile(timings, 50)), float(np.percentile(timings, 99))
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def run(sizes, dim, specs, k, n_queries):
+    faiss.omp_set_num_threads(1)   # latency per query, as in the API
+    print(f"{'n':>9}  {'index':<42} {'recall@' + str(k):>9} {'p50 ms':>8} {'p99 ms':>8} {'build s':>8}")
+
+    for n in sizes:
+        corpus = synthetic_corpus(n + n_queries, dim)
+        vectors, queries = corpus[:n], corpus[n:]
+
+        start = time.perf_counter()
+        flat = create_index(parse_spec("flat"), vectors)
+        build_s = time.perf_counter() - start
+        truth, p50, p99 = measure(flat, queries, k)
+        print(f"{n:>9}  {'flat (baseline)':<42} {1.0:>9.3f} {p50:>8.3f} {p99:>8.3f} {build_s:>8.2f}")
+
+        for text in specs:
+            spec = parse_spec(text)
+            start = time.perf_counter()
+            try:
+                index = create_index(spec, vectors)
+            except ValueError as e:
+                print(f"{n:>9}  {text:<42} skipped: {e}")
+                continue
+            build_s = time.perf_counter() - start
+            found, p50, p99 = measure(index, queries, k)
+            print(f"{n:>9}  {spec_to_str(spec):<42} {recall_at_k(found, truth):>9.3f} "
+                  f"{p50:>8.3f} {p99:>8.3f} {build_s:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall vs latency benchmark for FAISS index specs")
+    parser.add_argument("--sizes", default="10000,100000",
+                        help="comma-separated corpus sizes (e.g. 10000,100000,1000000)")
+    parser.add_argument("--dim", type=int, default=256,
+                        help="vector dimension (text-embedding-3-small is 1536)")
+    parser.add_argument("--specs", nargs="+", default=DEFAULT_SPECS, help="index specs to compare")
+    parser.add_argument("-k", type=int, default=5, help="neighbours per query")
+    parser.add_argument("--queries", type=int, default=500, help="number of queries")
+    args = parser.parse_args()
+
+    run([int(s) for s in args.sizes.split(",")], args.dim, args.specs, args.k, args.queries)
@@ -2,12 +2,28 @@
 FAISS Index Builder
 ===================
 Auto-discovers every *.json file in backend/data/,
-embeds each entry, and writes:
-  rag/faiss_index.bin   — the vector index
-  rag/store.json        — parallel list of readable texts
+embeds each entry, and writes a new index version:
+  rag/indexes/<version>/faiss_index.bin   — the vector index
+  rag/indexes/<version>/store.json        — parallel list of readable texts
+  rag/indexes/<version>/store.bin         — the same list as a memory-mappable binary store
+  rag/indexes/<version>/index_meta.json   — index type + parameters (see rag/index_spec.py)
+  rag/indexes/<version>/lexical.bin       — BM25 inverted index over the same texts (memory-mappable)
+  rag/indexes/<version>/metadata.json     — country/category/source/lang posting lists
+then points rag/indexes/manifest.json at it. Running API workers notice the
+manifest change and hot-swap to the new version (see rag/registry.py).
+
+Vectors are cached in rag/embeddings.db keyed by sha256(model, text), so a
+rebuild only calls the API for entries that are new or whose text changed.
+Each batch is stored as soon as it comes back, so a run that fails halfway
+keeps the vectors it already paid for.
+
+Texts are embedded in batches (EMBED_BATCH_SIZE per request) with up to
+EMBED_CONCURRENCY requests in flight; 429/5xx responses are retried with
+jittered backoff by ai/gateway.py. Output order always matches input order.
 
 Usage (from project root):
-    python -m rag.build_index
+    python -m rag.build_index [--batch-size 100] [--concurrency 4] [--index hnsw:M=32,efSearch=64]
+    python -m rag.build_index --prune     # drop vectors no entry uses anymore
 Or called programmatically from ingest.py:
     from rag.build_index import build; build()
 """
@@ -15,36 +31,92 @@ Or called programmatically from ingest.py:
 import os
 import json
 import glob
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
 import faiss
-from openai import OpenAI
 from dotenv import load_dotenv
 
+from ai import gateway
+
+from rag.embedding_store import EmbeddingStore, content_key
+from rag.docstore import write_docstore
+from rag.registry import new_version_dir, publish_version
+from rag.index_spec import parse_spec, spec_to_str, create_index, write_meta
+from rag.lexical import LexicalIndex
+from rag.filters import MetadataIndex
+from utils.text import detect_lang
+
 load_dotenv()
 
 BASE_DIR     = os.path.dirname(__file__)          # backend/rag/
 BACKEND_DIR  = os.path.dirname(BASE_DIR)          # backend/
 DATA_DIR     = os.path.join(BACKEND_DIR, "data")
-OUTPUT_INDEX = os.path.join(BASE_DIR, "faiss_index.bin")
-OUTPUT_STORE = os.path.join(BASE_DIR, "store.json")
-
-
-def embed(text: str, client: OpenAI) -> list:
-    resp = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text,
-    )
-    return resp.data[0].embedding
+EMBEDDINGS_DB = os.getenv("EMBEDDINGS_DB", os.path.join(BASE_DIR, "embeddings.db"))
+
+EMBED_MODEL       = "text-embedding-3-small"
+EMBED_BATCH_SIZE  = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+EMBED_DEADLINE    = float(os.getenv("EMBED_BATCH_DEADLINE", "300"))   # per batch, retries included
+INDEX_SPEC        = os.getenv("INDEX_SPEC", "flat")
+
+
+def embed_batch(texts: list, max_retries: int = EMBED_MAX_RETRIES) -> list:
+    """Embed a list of texts in ONE request; 429/5xx are retried by the gateway."""
+    resp = gateway.embed(model=EMBED_MODEL, input=texts, retries=max_retries,
+                           deadline=EMBED_DEADLINE, priority=gateway.BATCH)
+    # The API may return items out of order — sort by their index
+    return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+
+def embed_all(texts: list, batch_size: int = EMBED_BATCH_SIZE,
+              concurrency: int = EMBED_CONCURRENCY, on_batch=None) -> list:
+    """
+    Embed every text using batched requests run on a bounded thread pool.
+    Returns vectors in the same order as `texts`.
+
+    `on_batch(start, vectors)` is called as each batch completes, so callers
+    can persist what has been paid for even if a later batch fails. A failed
+    batch doesn't stop the others; the first error is raised at the end.
+    """
+    batch_size  = max(1, batch_size)
+    concurrency = max(1, concurrency)
+    starts  = list(range(0, len(texts), batch_size))
+    results = {}
+    done    = 0
+    error   = None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(embed_batch, texts[i:i + batch_size]): i for i in starts}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                print(f"  ! batch {i // batch_size + 1}/{len(starts)} failed: {e}")
+                error = error or e
+                continue
+            if on_batch is not None:
+                on_batch(i, results[i])
+            done += len(results[i])
+            print(f"  {done}/{len(texts)}")
 
+    if error is not None:
+        raise error
+    return [vector for i in starts for vector in results[i]]
 
-def build():
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+def collect_entries():
+    """
+    Read every data/*.json file and return (texts, store) — the combined
+    text to embed and the parallel list of store records.
+    """
     # ── Discover all JSON files in data/ ────────────────────────────────────
     data_files = sorted(glob.glob(os.path.join(DATA_DIR, "*.json")))
     if not data_files:
         print("No JSON files found in data/. Nothing to build.")
-        return
+        return [], []
 
     print(f"Found {len(data_files)} data file(s):")
     for f in data_files:
@@ -74,39 +146,109 @@ def build():
                 continue
             all_texts.append(combined)
             store.append({
-                "title":  title,
-                "text":   combined,
-                "source": os.path.basename(filepath),
+                "title":    title,
+                "text":     combined,
+                "source":   os.path.basename(filepath),
+                "country":  item.get("country", ""),
+                "category": item.get("category", ""),
+                "lang":     item.get("lang") or detect_lang(combined),
             })
 
+    return all_texts, store
+
+
+def build(batch_size: int = EMBED_BATCH_SIZE, concurrency: int = EMBED_CONCURRENCY,
+          index_spec: str = INDEX_SPEC):
+    spec = parse_spec(index_spec)
+    all_texts, store = collect_entries()
     if not all_texts:
         print("No entries found. Check your data files.")
         return
 
-    print(f"\nEmbedding {len(all_texts)} entries...")
+    # ── Reuse stored vectors, embed only new / edited texts ─────────────────
+    cache  = EmbeddingStore(EMBEDDINGS_DB)
+    keys   = [content_key(EMBED_MODEL, text) for text in all_texts]
+    cached = cache.get_many(keys)
 
-    # ── Embed ────────────────────────────────────────────────────────────────
-    vectors = []
-    for i, text in enumerate(all_texts):
-        vectors.append(embed(text, client))
-        if (i + 1) % 10 == 0 or (i + 1) == len(all_texts):
-            print(f"  {i + 1}/{len(all_texts)}")
+    # Identical texts share one key, so embed each distinct text once
+    pending = {}
+    for key, text in zip(keys, all_texts):
+        if key not in cached:
+            pending.setdefault(key, text)
+    missing       = list(pending)
+    missing_texts = list(pending.values())
 
-    vectors = np.array(vectors, dtype="float32")
+    print(f"\n{len(all_texts)} entries — {len(missing_texts)} new or changed text(s) to embed")
+
+    # ── Embed ────────────────────────────────────────────────────────────────
+    if missing_texts:
+        print(f"Embedding {len(missing_texts)} entries "
+              f"(batch size {batch_size}, concurrency {concurrency})...")
+
+        def store_batch(start, vectors):
+            # Saved as soon as they arrive: a failed run re-embeds only what's left
+            batch_keys = missing[start:start + len(vectors)]
+            cache.put_many(zip(batch_keys, vectors))
+            cached.update({key: np.asarray(v, dtype="float32") for key, v in zip(batch_keys, vectors)})
+
+        try:
+            embed_all(missing_texts, batch_size=batch_size, concurrency=concurrency, on_batch=store_batch)
+        except Exception:
+            stored = sum(key in cached for key in missing)
+            print(f"\nEmbedding failed; {stored}/{len(missing)} new vector(s) were saved and "
+                  f"will be reused by the next run.")
+            cache.close()
+            raise
+
+    cache.close()
+    vectors = np.array([cached[key] for key in keys], dtype="float32")
 
     # ── Build & save FAISS index ─────────────────────────────────────────────
     dimension = vectors.shape[1]
-    index     = faiss.IndexFlatL2(dimension)
-    index.add(vectors)
+    index     = create_index(spec, vectors)
 
-    faiss.write_index(index, OUTPUT_INDEX)
-    with open(OUTPUT_STORE, "w", encoding="utf-8") as f:
+    version, version_dir = new_version_dir()
+    output_index = os.path.join(version_dir, "faiss_index.bin")
+    output_store = os.path.join(version_dir, "store.json")
+
+    faiss.write_index(index, output_index)
+    with open(output_store, "w", encoding="utf-8") as f:
         json.dump(store, f, indent=2, ensure_ascii=False)
+    write_docstore(store, os.path.join(version_dir, "store.bin"))
+    LexicalIndex.build(all_texts).save(os.path.join(version_dir, "lexical.bin"))
+    MetadataIndex.build(store).save(os.path.join(version_dir, "metadata.json"))
+    write_meta(version_dir, spec, count=len(store), dimension=int(dimension))
+
+    # Only now, with every file complete, make the version live
+    publish_version(version, count=len(store), dimension=int(dimension), index=spec)
 
     print(f"\nFAISS index built — {len(store)} vectors saved.")
-    print(f"  {OUTPUT_INDEX}")
-    print(f"  {OUTPUT_STORE}")
+    print(f"  version {version} ({spec_to_str(spec)})")
+    print(f"  {version_dir}")
+
+
+def prune():
+    """Delete stored vectors that no current data entry refers to."""
+    all_texts, _ = collect_entries()
+    keep  = {content_key(EMBED_MODEL, text) for text in all_texts}
+    cache = EmbeddingStore(EMBEDDINGS_DB)
+    removed = cache.prune(keep)
+    print(f"\nPruned {removed} orphaned vector(s); {len(cache)} remain in {EMBEDDINGS_DB}")
+    cache.close()
 
 
 if __name__ == "__main__":
-    build()
+    parser = argparse.ArgumentParser(description="Build the FAISS index from data/*.json")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE,
+                        help="texts per embeddings request")
+    parser.add_argument("--concurrency", type=int, default=EMBED_CONCURRENCY,
+                        help="max embeddings requests in flight")
+    parser.add_argument("--index", default=INDEX_SPEC,
+                        help="index spec: flat | hnsw:M=..,efSearch=.. | ivf:nlist=..,nprobe=.. | ivfpq:nlist=..,m=..,nbits=..,nprobe=..")
+    parser.add_argument("--prune", action="store_true",
+                        help="remove orphaned vectors from the embedding store and exit")
+    args = parser.parse_args()
+    if args.prune:
+        prune()
+    else:
+        build(batch_size=args.batch_size, concurrency=args.concurrency, index_spec=args.index)
@@ -0,0 +1,171 @@
+"""
+Binary Document Store
+=====================
+Compact, memory-mapped replacement for rag/store.json.
+
+File layout (little endian, uint64 sections 8-byte aligned):
+  header        magic "NKDS", version, n_docs, n_strings, meta_len   (<4sIIII)
+  meta          JSON {"columns": [...]} naming the interned columns
+  str_offsets   uint64[n_strings + 1]   offsets into the strings blob
+  text_offsets  uint64[n_docs + 1]      offsets into the text blob
+  columns       uint32[n_columns, n_docs]  string ids per interned column
+  strings       UTF-8 blob of the interned values (title, source, ...)
+  texts         UTF-8 blob of every document text
+
+The file is opened with mmap, so uvicorn workers on the same box share the
+page cache instead of each holding a parsed copy, and only the documents
+that search() actually returns are decoded.
+
+Convert an existing store.json (from backend/):
+    python -m rag.docstore rag/store.json rag/store.bin
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import numpy as np
+
+from rag.filters import FILTER_FIELDS
+
+MAGIC   = b"NKDS"
+VERSION = 1
+HEADER  = struct.Struct("<4sIIII")
+
+# Every writer (build_index, registry, convert) stores the same columns: the
+# title plus the filter fields that MetadataIndex.build reads back from the store
+DEFAULT_COLUMNS = ["title"] + list(FILTER_FIELDS)
+
+
+def _pad8(n: int) -> int:
+    return (8 - n % 8) % 8
+
+
+def write_docstore(entries: list, path: str, columns: list = None) -> None:
+    """
+    Serialize `entries` (dicts with "text" plus interned columns) to `path`.
+    Written to a temp file first and swapped in atomically.
+    """
+    columns = list(columns or DEFAULT_COLUMNS)
+
+    strings, string_ids = [], {}
+    def intern(value) -> int:
+        value = "" if value is None else str(value)
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value)
+        return string_ids[value]
+
+    intern("")   # id 0 is always the empty string
+    column_ids = np.zeros((len(columns), len(entries)), dtype="<u4")
+    texts = []
+    for row, entry in enumerate(entries):
+        texts.append(entry.get("text", "").encode("utf-8"))
+        for col, name in enumerate(columns):
+            column_ids[col, row] = intern(entry.get(name, ""))
+
+    encoded_strings = [s.encode("utf-8") for s in strings]
+    str_offsets  = np.zeros(len(strings) + 1, dtype="<u8")
+    str_offsets[1:] = np.cumsum([len(s) for s in encoded_strings])
+    text_offsets = np.zeros(len(texts) + 1, dtype="<u8")
+    text_offsets[1:] = np.cumsum([len(t) for t in texts])
+
+    meta = json.dumps({"columns": columns}).encode("utf-8")
+    head = HEADER.pack(MAGIC, VERSION, len(entries), len(strings), len(meta)) + meta
+    head += b"\0" * _pad8(len(head))
+    col_bytes = column_ids.tobytes()
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"   # workers may regenerate the same file at once
+    with open(tmp_path, "wb") as f:
+        f.write(head)
+        f.write(str_offsets.tobytes())
+        f.write(text_offsets.tobytes())
+        f.write(col_bytes)
+        f.write(b"\0" * _pad8(len(col_bytes)))
+        f.write(b"".join(encoded_strings))
+        f.write(b"".join(texts))
+    os.replace(tmp_path, path)
+
+
+class DocStore:
+    """Read-only, list-like view over a store.bin file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, n_docs, n_strings, meta_len = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a v{VERSION} document store")
+
+        pos = HEADER.size
+        meta = json.loads(bytes(self._mm[pos:pos + meta_len]).decode("utf-8"))
+        pos += meta_len
+        pos += _pad8(pos)
+
+        self.columns = meta["columns"]
+        self._n = n_docs
+
+        self._str_offsets = np.frombuffer(self._mm, dtype="<u8", count=n_strings + 1, offset=pos)
+        pos += self._str_offsets.nbytes
+        self._text_offsets = np.frombuffer(self._mm, dtype="<u8", count=n_docs + 1, offset=pos)
+        pos += self._text_offsets.nbytes
+        self._column_ids = np.frombuffer(
+            self._mm, dtype="<u4", count=len(self.columns) * n_docs, offset=pos
+        ).reshape(len(self.columns), n_docs)
+        pos += self._column_ids.nbytes
+        pos += _pad8(self._column_ids.nbytes)
+
+        self._strings_start = pos
+        self._texts_start = pos + int(self._str_offsets[-1])
+        self._string_cache = {}
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _string(self, sid: int) -> str:
+        value = self._string_cache.get(sid)
+        if value is None:
+            start = self._strings_start + int(self._str_offsets[sid])
+            end = self._strings_start + int(self._str_offsets[sid + 1])
+            value = self._mm[start:end].decode("utf-8")
+            self._string_cache[sid] = value
+        return value
+
+    def text(self, idx: int) -> str:
+        start = self._texts_start + int(self._text_offsets[idx])
+        end = self._texts_start + int(self._text_offsets[idx + 1])
+        return self._mm[start:end].decode("utf-8")
+
+    def __getitem__(self, idx):
+        idx = int(idx)
+        if idx < 0:
+            idx += self._n
+        if not 0 <= idx < self._n:
+            raise IndexError("document index out of range")
+        doc = {name: self._string(int(self._column_ids[col, idx]))
+               for col, name in enumerate(self.columns)}
+        doc["text"] = self.text(idx)
+        return doc
+
+    def __iter__(self):
+        for idx in range(self._n):
+            yield self[idx]
+
+
+def convert(json_path: str, bin_path: str) -> int:
+    """Convert a store.json list into the binary format. Returns doc count."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    write_docstore(entries, bin_path)
+    return len(entries)
+
+
+if __name__ == "__main__":
+    here = os.path.dirname(__file__)
+    src = sys.argv[1] if len(sys.argv) > 1 else os.path.join(here, "store.json")
+    dst = sys.argv[2] if len(sys.argv) > 2 else os.path.join(here, "store.bin")
+    n = convert(src, dst)
+    print(f"Converted {n} document(s): {src} -> {dst}")
@@ -0,0 +1,110 @@
+"""
+Query Embedding Cache
+=====================
+Two-tier cache in front of the embeddings API:
+  1. bounded in-process LRU (per worker)
+  2. EmbeddingStore on disk (survives restarts, shared by workers), trimmed
+     to disk_max_rows / disk_max_age at startup and every TRIM_INTERVAL
+
+Keys are the model name plus the normalized query, so "Canada Student Visa"
+and "canada  student visa", or ويزاي / ویزای, resolve to the same vector.
+"""
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from utils.text import normalize_text
+
+TRIM_INTERVAL = 300.0   # seconds between disk-tier trims
+
+
+class QueryEmbeddingCache:
+    def __init__(self, store=None, maxsize: int = 2048, model: str = "text-embedding-3-small",
+                 disk_max_rows: int = None, disk_max_age: float = None):
+        self.store = store            # EmbeddingStore or None (memory only)
+        self.maxsize = maxsize
+        self.model = model
+        self.disk_max_rows = disk_max_rows   # bounds of the disk tier (None = unbounded)
+        self.disk_max_age = disk_max_age     # seconds
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._trimmed_at = 0.0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_trimmed = 0
+        self._trim()
+
+    def key(self, text: str) -> str:
+        raw = f"{self.model}\x00{normalize_text(text)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, text: str):
+        key = self.key(text)
+
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+        vector = self.store.get(key) if self.store is not None else None
+
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, vector)
+        return vector
+
+    def peek(self, text: str):
+        """In-memory lookup that doesn't touch disk or the hit/miss counters."""
+        with self._lock:
+            return self._lru.get(self.key(text))
+
+    def set(self, text: str, vector) -> None:
+        key = self.key(text)
+        with self._lock:
+            self._remember(key, vector)
+        if self.store is not None:
+            self.store.put(key, vector)
+            self._trim()
+
+    def _trim(self) -> None:
+        """Apply the disk-tier bounds, at most every TRIM_INTERVAL seconds."""
+        if self.store is None or not (self.disk_max_rows or self.disk_max_age):
+            return
+        now = time.time()
+        with self._lock:
+            if now - self._trimmed_at < TRIM_INTERVAL:
+                return
+            self._trimmed_at = now
+        removed = self.store.trim(self.disk_max_rows, self.disk_max_age)
+        with self._lock:
+            self.disk_trimmed += removed
+
+    def _remember(self, key, vector):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._lru),
+                "memory_maxsize": self.maxsize,
+                "disk_max_rows": self.disk_max_rows,
+                "disk_max_age": self.disk_max_age,
+                "disk_trimmed": self.disk_trimmed,
+            }
@@ -0,0 +1,140 @@
+"""
+Embedding Store
+===============
+Small SQLite-backed key → float32 vector store.
+
+Used as:
+  - the disk tier of the query embedding cache, so vectors survive
+    restarts and are shared between uvicorn workers on the same box
+  - the content-hash store of build_index, so rebuilds only embed
+    new or edited texts
+WAL mode lets several processes read while one writes. Rows carry the time
+they were stored, so a cache can be bounded with trim().
+"""
+
+import time
+import hashlib
+import threading
+import numpy as np
+
+from utils.sqlite import connect
+
+
+def content_key(model: str, text: str) -> str:
+    """Stable key for (model, text) — changes whenever either one does."""
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect(path, (
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "  key       TEXT PRIMARY KEY,"
+            "  dim       INTEGER NOT NULL,"
+            "  vector    BLOB NOT NULL,"
+            "  stored_at REAL NOT NULL DEFAULT 0"
+            ")",
+        ))
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")}
+        if "stored_at" not in columns:   # stores created before trimming: age counts from now
+            self._conn.execute("ALTER TABLE embeddings ADD COLUMN stored_at REAL NOT NULL DEFAULT 0")
+            self._conn.execute("UPDATE embeddings SET stored_at = ?", (time.time(),))
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_stored_at ON embeddings (stored_at)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype="float32")
+
+    def put(self, key: str, vector) -> None:
+        vector = np.asarray(vector, dtype="float32")
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, dim, vector, stored_at) VALUES (?, ?, ?, ?)",
+                (key, int(vector.shape[0]), vector.tobytes(), time.time()),
+            )
+            self._conn.commit()
+
+    def get_many(self, keys: list) -> dict:
+        """Return {key: vector} for every key that is present."""
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype="float32")
+        return found
+
+    def put_many(self, items) -> None:
+        """Insert (key, vector) pairs in a single transaction."""
+        rows = []
+        now = time.time()
+        for key, vector in items:
+            vector = np.asarray(vector, dtype="float32")
+            rows.append((key, int(vector.shape[0]), vector.tobytes(), now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dim, vector, stored_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def keys(self) -> set:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT key FROM embeddings")}
+
+    def prune(self, keep) -> int:
+        """Delete every vector whose key is not in `keep`. Returns rows removed."""
+        orphans = list(self.keys() - set(keep))
+        with self._lock:
+            for i in range(0, len(orphans), 500):
+                chunk = orphans[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                self._conn.execute(f"DELETE FROM embeddings WHERE key IN ({marks})", chunk)
+            self._conn.commit()
+            if orphans:
+                self._conn.execute("VACUUM")
+        return len(orphans)
+
+    def trim(self, max_rows: int = None, max_age: float = None) -> int:
+        """
+        Delete vectors stored more than `max_age` seconds ago, then the oldest
+        beyond `max_rows`. Returns rows removed; freed pages are reused.
+        """
+        removed = 0
+        with self._lock:
+            if max_age:
+                cursor = self._conn.execute(
+                    "DELETE FROM embeddings WHERE stored_at < ?", (time.time() - max_age,)
+                )
+                removed += cursor.rowcount
+            if max_rows:
+                cursor = self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    "  SELECT key FROM embeddings ORDER BY stored_at DESC LIMIT -1 OFFSET ?"
+                    ")", (max_rows,)
+                )
+                removed += cursor.rowcount
+            self._conn.commit()
+        return removed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
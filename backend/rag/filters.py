@@ -0,0 +1,103 @@
+"""
+Metadata Filters
+================
+Posting lists (field → value → sorted doc ids) over the store entries,
+built by build_index and saved as metadata.json next to faiss_index.bin.
+
+RAGSearchEngine resolves a filter dict such as
+    {"country": "Germany", "category": ["work", "study"]}
+to the set of allowed doc ids (OR within a field, AND across fields) and
+hands it to FAISS as an ID selector, so filtering happens inside the search
+instead of over-fetching and discarding hits.
+
+A filter on a field the index carries no values for (e.g. country on an
+index built before that metadata existed) raises UnsupportedFilter rather
+than silently matching nothing.
+"""
+
+import json
+import numpy as np
+
+from utils.text import detect_lang
+
+FILTER_FIELDS = ("country", "category", "source", "lang")
+
+
+class UnsupportedFilter(ValueError):
+    """Filter on an unknown field, or one this index has no metadata for."""
+
+
+def _norm(value) -> str:
+    return str(value).strip().lower()
+
+
+class MetadataIndex:
+    def __init__(self, postings: dict):
+        # field -> value -> np.ndarray[int64] of doc ids (sorted)
+        self.postings = {
+            field: {value: np.asarray(ids, dtype="int64") for value, ids in values.items()}
+            for field, values in postings.items()
+        }
+
+    @classmethod
+    def build(cls, docs) -> "MetadataIndex":
+        postings = {field: {} for field in FILTER_FIELDS}
+        for doc_id, doc in enumerate(docs):
+            for field in FILTER_FIELDS:
+                value = doc.get(field)
+                if field == "lang" and not value:
+                    value = detect_lang(doc.get("text", ""))
+                if value:
+                    postings[field].setdefault(_norm(value), []).append(doc_id)
+        return cls(postings)
+
+    def save(self, path: str) -> None:
+        data = {
+            field: {value: ids.tolist() for value, ids in values.items()}
+            for field, values in self.postings.items()
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path: str) -> "MetadataIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def values(self) -> dict:
+        """Available filter values per field, with document counts."""
+        return {
+            field: {value: int(ids.size) for value, ids in sorted(values.items())}
+            for field, values in self.postings.items()
+        }
+
+    def check(self, filters: dict) -> None:
+        """Raise UnsupportedFilter if `filters` uses a field this index can't filter on."""
+        for field, wanted in (filters or {}).items():
+            if wanted is None or wanted == [] or wanted == "":
+                continue
+            if field not in FILTER_FIELDS:
+                raise UnsupportedFilter(f"Unknown filter field '{field}'")
+            if not self.postings.get(field):
+                raise UnsupportedFilter(
+                    f"The current index has no '{field}' metadata; rebuild it with build_index to filter on it"
+                )
+
+    def resolve(self, filters: dict):
+        """
+        Return the sorted array of doc ids matching `filters`, or None when no
+        filter is active. Unsupported fields raise UnsupportedFilter.
+        """
+        self.check(filters)
+        allowed = None
+        for field, wanted in (filters or {}).items():
+            if wanted is None or wanted == [] or wanted == "":
+                continue
+            if isinstance(wanted, str):
+                wanted = [wanted]
+
+            lists = [self.postings.get(field, {}).get(_norm(v)) for v in wanted]
+            lists = [ids for ids in lists if ids is not None]
+            ids = np.unique(np.concatenate(lists)) if lists else np.empty(0, dtype="int64")
+            allowed = ids if allowed is None else np.intersect1d(allowed, ids, assume_unique=True)
+        return allowed
@@ -0,0 +1,137 @@
+"""
+Index Specs
+===========
+Pluggable FAISS index types for build_index.
+
+A spec is written as "<type>[:key=value,...]", e.g.
+    flat
+    hnsw:M=32,efConstruction=80,efSearch=64
+    ivf:nlist=1024,nprobe=16
+    ivfpq:nlist=1024,m=16,nbits=8,nprobe=16
+
+build_index turns the spec into an index and records it in
+index_meta.json next to faiss_index.bin; RAGSearchEngine reads it back and
+applies the search-time knobs (efSearch / nprobe).
+"""
+
+import os
+import json
+import math
+import faiss
+
+INDEX_META = "index_meta.json"
+
+DEFAULTS = {
+    "flat":  {},
+    "hnsw":  {"M": 32, "efConstruction": 80, "efSearch": 64},
+    "ivf":   {"nlist": 1024, "nprobe": 16},
+    "ivfpq": {"nlist": 1024, "m": 16, "nbits": 8, "nprobe": 16},
+}
+
+
+def parse_spec(text: str) -> dict:
+    """Parse "hnsw:M=32,efSearch=64" into {"type": "hnsw", "params": {...}}."""
+    text = (text or "flat").strip()
+    kind, _, rest = text.partition(":")
+    kind = kind.strip().lower()
+    if kind not in DEFAULTS:
+        raise ValueError(f"Unknown index type '{kind}' (expected one of {', '.join(DEFAULTS)})")
+
+    params = dict(DEFAULTS[kind])
+    for pair in filter(None, (p.strip() for p in rest.split(","))):
+        key, sep, value = pair.partition("=")
+        key = key.strip()
+        if not sep or key not in DEFAULTS[kind]:
+            raise ValueError(f"Invalid parameter '{pair}' for index type '{kind}'")
+        params[key] = int(value)
+    return {"type": kind, "params": params}
+
+
+def spec_to_str(spec: dict) -> str:
+    params = ",".join(f"{k}={v}" for k, v in spec["params"].items())
+    return f"{spec['type']}:{params}" if params else spec["type"]
+
+
+def create_index(spec: dict, vectors):
+    """Build (and train, if needed) an index for `vectors` according to `spec`."""
+    kind, params = spec["type"], spec["params"]
+    n, dimension = vectors.shape
+
+    if kind == "flat":
+        index = faiss.IndexFlatL2(dimension)
+
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, params["M"])
+        index.hnsw.efConstruction = params["efConstruction"]
+
+    elif kind in ("ivf", "ivfpq"):
+        # k-means needs ~39 points per centroid; shrink nlist on small corpora
+        nlist = max(1, min(params["nlist"], n // 39))
+        params["nlist"] = nlist
+        quantizer = faiss.IndexFlatL2(dimension)
+        if kind == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            if dimension % params["m"]:
+                raise ValueError(f"ivfpq: dimension {dimension} is not divisible by m={params['m']}")
+            # PQ k-means needs a training point per code (2**nbits); shrink nbits likewise
+            if n < 2:
+                raise ValueError(f"ivfpq: needs at least 2 vectors to train, got {n}")
+            params["nbits"] = min(params["nbits"], int(math.log2(n)))
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, params["m"], params["nbits"])
+        index.train(vectors)
+
+    else:
+        raise ValueError(f"Unknown index type '{kind}'")
+
+    index.add(vectors)
+    apply_search_params(index, spec)
+    return index
+
+
+def apply_search_params(index, spec: dict) -> None:
+    """Set the query-time knobs recorded in `spec` on a loaded index."""
+    if not spec:
+        return
+    params = spec.get("params", {})
+    if spec["type"] == "hnsw" and "efSearch" in params:
+        faiss.downcast_index(index).hnsw.efSearch = params["efSearch"]
+    elif spec["type"] in ("ivf", "ivfpq") and "nprobe" in params:
+        faiss.extract_index_ivf(index).nprobe = params["nprobe"]
+
+
+MAX_EF_SEARCH = 2048   # upper bound when widening HNSW for a filtered search
+
+
+def search_params(spec: dict, selector, selectivity: float = 1.0, k: int = 1):
+    """
+    faiss.SearchParameters restricting a search to `selector`. Passing params
+    overrides the index's own knobs, so efSearch / nprobe are carried over —
+    and widened by 1 / `selectivity` (fraction of ids the selector allows),
+    since HNSW and IVF only find filtered hits among the candidates they visit.
+    """
+    kind = spec["type"] if spec else "flat"
+    params = spec.get("params", {}) if spec else {}
+    widen = 1.0 / min(1.0, max(selectivity, 1e-6))
+    if kind == "hnsw":
+        ef = max(params.get("efSearch", 16), k)
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=int(min(MAX_EF_SEARCH, max(ef, ef * widen))))
+    if kind in ("ivf", "ivfpq"):
+        nprobe = params.get("nprobe", 1)
+        nlist = params.get("nlist", nprobe)
+        return faiss.SearchParametersIVF(sel=selector, nprobe=int(min(nlist, math.ceil(nprobe * widen))))
+    return faiss.SearchParameters(sel=selector)
+
+
+def write_meta(directory: str, spec: dict, **extra) -> None:
+    with open(os.path.join(directory, INDEX_META), "w", encoding="utf-8") as f:
+        json.dump({"index": spec, **extra}, f, indent=2)
+
+
+def read_meta(index_path: str):
+    """Return the spec stored next to `index_path`, or None for legacy indexes."""
+    path = os.path.join(os.path.dirname(index_path), INDEX_META)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("index")
@@ -0,0 +1,183 @@
+"""
+Lexical Index
+=============
+Local BM25 inverted index over the same store entries as the FAISS index.
+
+Catches what embeddings blur: exact program names and form numbers
+("Subclass 500", "Blue Card") and Persian keywords. Needs no network call,
+so it doubles as the degraded mode when the embeddings API is slow or down.
+
+Saved as lexical.bin next to faiss_index.bin by build_index, in a
+memory-mapped layout like store.bin (little endian, sections 8-byte aligned):
+  header        magic "NKLX", version, n_docs, n_terms   (<4sIII)
+  doc_len       uint32[n_docs]
+  term_offsets  uint64[n_terms + 1]   offsets into the terms blob
+  post_offsets  uint64[n_terms + 1]   each term's slice of doc_ids / tfs
+  doc_ids       uint32[n_postings]
+  tfs           uint32[n_postings]
+  terms         UTF-8 blob of the terms, sorted by their bytes
+so workers share the page cache and a query only touches the posting
+slices of its own terms. Versions built before that carry lexical.json,
+which is still read.
+"""
+
+import os
+import json
+import math
+import mmap
+import struct
+import numpy as np
+from collections import Counter, defaultdict
+
+from utils.text import tokenize
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60   # reciprocal-rank fusion constant
+
+MAGIC   = b"NKLX"
+VERSION = 1
+HEADER  = struct.Struct("<4sIII")
+
+
+def _pad8(n: int) -> int:
+    return (8 - n % 8) % 8
+
+
+class LexicalIndex:
+    def __init__(self, terms, term_offsets, post_offsets, doc_ids, tfs, doc_len, mm=None):
+        self._terms = terms                # bytes-like blob of sorted terms
+        self._term_offsets = term_offsets
+        self._post_offsets = post_offsets
+        self._doc_ids = doc_ids
+        self._tfs = tfs
+        self.doc_len = doc_len
+        self._mm = mm                      # keeps the mapping alive
+        self.n_docs = len(doc_len)
+        self.n_terms = len(term_offsets) - 1
+        self.avgdl = float(doc_len.mean()) if self.n_docs else 0.0
+
+    @classmethod
+    def _from_postings(cls, postings: dict, doc_len) -> "LexicalIndex":
+        """postings: term -> [[doc_id, tf], ...]"""
+        encoded = sorted((term.encode("utf-8"), plist) for term, plist in postings.items())
+        term_offsets = np.zeros(len(encoded) + 1, dtype="<u8")
+        term_offsets[1:] = np.cumsum([len(term) for term, _ in encoded])
+        post_offsets = np.zeros(len(encoded) + 1, dtype="<u8")
+        post_offsets[1:] = np.cumsum([len(plist) for _, plist in encoded])
+        pairs = np.array([pair for _, plist in encoded for pair in plist], dtype="<u4").reshape(-1, 2)
+        return cls(b"".join(term for term, _ in encoded), term_offsets, post_offsets,
+                   np.ascontiguousarray(pairs[:, 0]), np.ascontiguousarray(pairs[:, 1]),
+                   np.asarray(doc_len, dtype="<u4"))
+
+    @classmethod
+    def build(cls, texts) -> "LexicalIndex":
+        postings = defaultdict(list)
+        doc_len = []
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_len.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term].append([doc_id, tf])
+        return cls._from_postings(postings, doc_len)
+
+    def save(self, path: str) -> None:
+        """Write the binary layout; temp file first, swapped in atomically."""
+        head = HEADER.pack(MAGIC, VERSION, self.n_docs, self.n_terms)
+        sections = [
+            np.asarray(self.doc_len, dtype="<u4").tobytes(),
+            np.asarray(self._term_offsets, dtype="<u8").tobytes(),
+            np.asarray(self._post_offsets, dtype="<u8").tobytes(),
+            np.asarray(self._doc_ids, dtype="<u4").tobytes(),
+            np.asarray(self._tfs, dtype="<u4").tobytes(),
+            bytes(self._terms),
+        ]
+        tmp_path = f"{path}.{os.getpid()}.tmp"   # workers may generate the same file at once
+        with open(tmp_path, "wb") as f:
+            f.write(head + b"\0" * _pad8(len(head)))
+            for data in sections:
+                f.write(data + b"\0" * _pad8(len(data)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        if path.endswith(".json"):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return cls._from_postings(data["postings"], data["doc_len"])
+
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_docs, n_terms = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a v{VERSION} lexical index")
+
+        pos = HEADER.size + _pad8(HEADER.size)
+        def section(dtype, count):
+            nonlocal pos
+            array = np.frombuffer(mm, dtype=dtype, count=count, offset=pos)
+            pos += array.nbytes + _pad8(array.nbytes)
+            return array
+
+        doc_len = section("<u4", n_docs)
+        term_offsets = section("<u8", n_terms + 1)
+        post_offsets = section("<u8", n_terms + 1)
+        doc_ids = section("<u4", int(post_offsets[-1]))
+        tfs = section("<u4", int(post_offsets[-1]))
+        terms = memoryview(mm)[pos:pos + int(term_offsets[-1])]
+        return cls(terms, term_offsets, post_offsets, doc_ids, tfs, doc_len, mm)
+
+    def _term(self, i: int) -> bytes:
+        return bytes(self._terms[int(self._term_offsets[i]):int(self._term_offsets[i + 1])])
+
+    def _postings(self, term: str):
+        """(doc_ids, tfs) slices for `term`, found by binary search, or None."""
+        key = term.encode("utf-8")
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.n_terms or self._term(lo) != key:
+            return None
+        start, end = int(self._post_offsets[lo]), int(self._post_offsets[lo + 1])
+        return self._doc_ids[start:end], self._tfs[start:end]
+
+    def search(self, query: str, k: int = 5, allowed=None) -> list:
+        """
+        Return [(doc_id, score), ...] ranked by BM25, best first.
+        `allowed` (sorted array or set of doc ids) restricts scoring to those documents.
+        """
+        if allowed is not None and not isinstance(allowed, np.ndarray):
+            allowed = np.array(sorted(allowed), dtype="int64")
+        hits, scores = [], []
+        for term in set(tokenize(query)):
+            found = self._postings(term)
+            if found is None:
+                continue
+            doc_ids, tfs = found
+            idf = math.log(1 + (self.n_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            if allowed is not None:
+                keep = np.isin(doc_ids, allowed, assume_unique=True)
+                doc_ids, tfs = doc_ids[keep], tfs[keep]
+            tf = tfs.astype("float64")
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[doc_ids] / (self.avgdl or 1.0))
+            hits.append(doc_ids)
+            scores.append(idf * tf * (BM25_K1 + 1) / (tf + norm))
+        if not hits:
+            return []
+        ids, inverse = np.unique(np.concatenate(hits), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+        order = np.lexsort((ids, -totals))[:k]   # best first, ties by doc id
+        return [(int(ids[i]), float(totals[i])) for i in order]
+
+
+def rrf_fuse(*rankings, k: int = 5) -> list:
+    """Reciprocal-rank fusion of several ranked doc-id lists."""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] += 1.0 / (RRF_K + rank + 1)
+    return [doc_id for doc_id, _ in sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]]
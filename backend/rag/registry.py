@@ -0,0 +1,194 @@
+"""
+Index Registry
+==============
+Versioned on-disk index layout plus hot reload for the running API.
+
+Layout:
+  rag/indexes/<version>/faiss_index.bin
+  rag/indexes/<version>/store.bin
+  rag/indexes/<version>/store.json
+  rag/indexes/<version>/index_meta.json   index type + search-time params
+  rag/indexes/manifest.json          {"version": "...", "built_at": "...", "count": N}
+
+build_index writes a complete new version directory and then atomically
+replaces manifest.json. Every API worker polls the manifest (and exposes an
+admin endpoint); when the version changes it loads and warms the new
+RAGSearchEngine off to the side, then swaps the reference in one step.
+Requests that already hold the old engine finish on it; new ones get the new one.
+
+If no manifest exists yet, the legacy rag/faiss_index.bin + rag/store.json
+files are served. store.bin is never committed: it is generated from
+store.json on load whenever it is missing or older.
+"""
+
+import os
+import json
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from rag.docstore import write_docstore
+
+RAG_DIR       = os.path.dirname(__file__)
+INDEX_ROOT    = os.getenv("INDEX_ROOT", os.path.join(RAG_DIR, "indexes"))
+MANIFEST_PATH = os.path.join(INDEX_ROOT, "manifest.json")
+KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "3"))
+
+LEGACY_VERSION = "legacy"
+
+
+# ── Manifest helpers (used by build_index) ──────────────────────────────────
+
+def read_manifest():
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def new_version_dir() -> tuple:
+    """Create and return (version, path) for a fresh index version."""
+    version = datetime.utcnow().strftime("%Y%m%d-%H%M%S-%f")
+    path = os.path.join(INDEX_ROOT, version)
+    os.makedirs(path, exist_ok=True)
+    return version, path
+
+
+def publish_version(version: str, **meta) -> None:
+    """Point manifest.json at `version` (atomic rename) and prune old versions."""
+    manifest = {
+        "version": version,
+        "built_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        **meta,
+    }
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+    # Old files stay valid for processes that still have them mmap'd
+    versions = sorted(
+        d for d in os.listdir(INDEX_ROOT)
+        if os.path.isdir(os.path.join(INDEX_ROOT, d))
+    )
+    for old in versions[:-KEEP_VERSIONS] if KEEP_VERSIONS > 0 else []:
+        if old != version:
+            shutil.rmtree(os.path.join(INDEX_ROOT, old), ignore_errors=True)
+
+
+def current_paths() -> tuple:
+    """Return (version, index_path, store_path) for the live index."""
+    manifest = read_manifest()
+    if manifest:
+        version_dir = os.path.join(INDEX_ROOT, manifest["version"])
+        index_path = os.path.join(version_dir, "faiss_index.bin")
+        if os.path.exists(index_path):
+            return manifest["version"], index_path, _store_path(version_dir)
+
+    return LEGACY_VERSION, os.path.join(RAG_DIR, "faiss_index.bin"), _store_path(RAG_DIR)
+
+
+def _store_path(directory: str) -> str:
+    """
+    Prefer the memory-mapped binary store. store.json is the source of truth
+    and store.bin is derived from it, so a missing or older store.bin is
+    (re)generated first; if that fails (e.g. read-only disk) store.json is served.
+    """
+    store_bin = os.path.join(directory, "store.bin")
+    store_json = os.path.join(directory, "store.json")
+    if not os.path.exists(store_json):
+        return store_bin if os.path.exists(store_bin) else store_json
+    if os.path.exists(store_bin) and os.path.getmtime(store_bin) >= os.path.getmtime(store_json):
+        return store_bin
+    try:
+        with open(store_json, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        write_docstore(entries, store_bin)
+    except (OSError, ValueError) as e:
+        print(f"[RAG] couldn't generate {store_bin}, serving store.json: {e}")
+        return store_json
+    print(f"[RAG] generated {store_bin} from store.json ({len(entries)} docs)")
+    return store_bin
+
+
+# ── Live engine holder (used by the API) ────────────────────────────────────
+
+class EngineRegistry:
+    """
+    Holds the live RAGSearchEngine and swaps it atomically on reload.
+
+    `factory(index_path, store_path)` builds an engine; handlers should read
+    `registry.engine` once per request and keep using that reference.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._reload_lock = threading.Lock()
+        self._manifest_mtime = self._mtime()
+        self.version, index_path, store_path = current_paths()
+        self.engine = factory(index_path, store_path)
+        self.loaded_at = time.time()
+        self._watcher = None
+
+    @staticmethod
+    def _mtime():
+        try:
+            return os.stat(MANIFEST_PATH).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def reload(self, force: bool = False) -> dict:
+        """Load the version named by the manifest and swap it in if it changed."""
+        with self._reload_lock:
+            self._manifest_mtime = self._mtime()
+            version, index_path, store_path = current_paths()
+            if version == self.version and not force:
+                return {"reloaded": False, "version": self.version}
+
+            engine = self._factory(index_path, store_path)
+            self._warm(engine)
+
+            previous, self.engine, self.version = self.version, engine, version
+            self.loaded_at = time.time()
+            print(f"[RAG] index reloaded: {previous} -> {version}")
+            return {"reloaded": True, "version": version, "previous": previous}
+
+    @staticmethod
+    def _warm(engine):
+        # One local query pages the index in, so the first real request after
+        # the swap doesn't pay the cold-start cost. No embedding call needed.
+        if engine.index.ntotal:
+            engine.index.search(np.zeros((1, engine.index.d), dtype="float32"), 1)
+        if len(engine.store):
+            engine.store[0]
+
+    def watch(self, interval: float = 5.0) -> None:
+        """Poll manifest.json in a daemon thread and reload when it changes."""
+        if self._watcher is not None or interval <= 0:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                if self._mtime() == self._manifest_mtime:
+                    continue
+                try:
+                    self.reload()
+                except Exception as e:
+                    # Keep serving the old version; retry on the next change
+                    print(f"[RAG] index reload failed: {e}")
+
+        self._watcher = threading.Thread(target=loop, name="index-watcher", daemon=True)
+        self._watcher.start()
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "index": self.engine.index_spec,
+            "loaded_at": datetime.utcfromtimestamp(self.loaded_at).isoformat(timespec="seconds") + "Z",
+            "documents": len(self.engine.store),
+        }
@@ -1,36 +1,233 @@
 import os
 import json
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import faiss
 import numpy as np
 from dotenv import load_dotenv
-from openai import OpenAI
+from ai import gateway
+from rag.docstore import DocStore
+from rag.index_spec import read_meta, apply_search_params, search_params
+from rag.lexical import LexicalIndex, rrf_fuse
+from rag.filters import MetadataIndex
+from utils.singleflight import SingleFlight
+from utils.text import normalize_text
 
 # Load environment variables
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+EMBED_MODEL = "text-embedding-3-small"
+# Query embeddings are on the request path and hybrid search can fall back
+# to lexical, so give up on a slow embeddings API early
+EMBED_DEADLINE = float(os.getenv("EMBED_DEADLINE", "8"))
+
+SEARCH_MODES = ("hybrid", "vector", "lexical")
+CANDIDATES_PER_K = 4   # each retriever contributes k * 4 candidates to fusion
+# Filters matching at most this many docs are scored exactly (reconstruct +
+# distance) instead of through HNSW / IVF, which miss most of a small set
+EXACT_FILTER_MAX = int(os.getenv("EXACT_FILTER_MAX", "4096"))
+
+# FAISS and BM25 work for async callers runs here, off the event loop.
+# FAISS releases the GIL while searching, so these threads run in parallel.
+SEARCH_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SEARCH_THREADS", "4")),
+    thread_name_prefix="rag-search",
+)
+
+# Concurrent identical queries share one embeddings request
+embed_flight = SingleFlight("embeddings")
+
+# Memory-map the index so every worker shares the same page cache
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+def load_index(index_path):
+    try:
+        return faiss.read_index(index_path, MMAP_FLAGS)
+    except RuntimeError:
+        # Index type without mmap support — fall back to a private copy
+        return faiss.read_index(index_path)
+
+
+def load_store(store_path):
+    if store_path.endswith(".bin"):
+        return DocStore(store_path)
+    with open(store_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_lexical(index_path, store, store_path):
+    """
+    Prefer the memory-mapped lexical.bin. An index built without one gets it
+    generated (from lexical.json, or from the store for older indexes) so
+    later workers just map it; if it can't be written, this worker keeps
+    its own copy in memory.
+    """
+    directory = os.path.dirname(index_path)
+    path = os.path.join(directory, "lexical.bin")
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(store_path):
+        return LexicalIndex.load(path)
+    legacy = os.path.join(directory, "lexical.json")
+    if os.path.exists(legacy):
+        lexical = LexicalIndex.load(legacy)
+    else:
+        lexical = LexicalIndex.build(doc["text"] for doc in store)
+    try:
+        lexical.save(path)
+    except OSError as e:
+        print(f"[RAG] couldn't generate {path}, keeping the lexical index in memory: {e}")
+        return lexical
+    print(f"[RAG] generated {path} ({lexical.n_docs} docs, {lexical.n_terms} terms)")
+    return LexicalIndex.load(path)
+
+
+def load_metadata(index_path, store):
+    path = os.path.join(os.path.dirname(index_path), "metadata.json")
+    if os.path.exists(path):
+        return MetadataIndex.load(path)
+    # Older index — only what the store itself carries (source, maybe more)
+    return MetadataIndex.build(store)
+
 
 class RAGSearchEngine:
-    def __init__(self, index_path, store_path):
-        self.index = faiss.read_index(index_path)
-        with open(store_path, "r") as f:
-            self.store = json.load(f)
+    def __init__(self, index_path, store_path, embedding_cache=None):
+        self.index = load_index(index_path)
+        self.index_spec = read_meta(index_path)   # None for legacy flat indexes
+        apply_search_params(self.index, self.index_spec)
+        self.store = load_store(store_path)   # DocStore (store.bin) or list (store.json)
+        self.lexical = load_lexical(index_path, self.store, store_path)
+        self.metadata = load_metadata(index_path, self.store)
+        self.embedding_cache = embedding_cache   # QueryEmbeddingCache or None
+        self._reconstructable = None             # decided on the first filtered search
+        self._reconstruct_lock = threading.Lock()
 
     def embed(self, text):
-        emb = client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text
-        )
-        return np.array(emb.data[0].embedding, dtype="float32")
-
-    def search(self, query, k=5):
-        vector = np.array([self.embed(query)])
-        distances, indices = self.index.search(vector, k)
-
-        results = []
-        for idx in indices[0]:
-            if idx == -1:
-                continue
-            results.append(self.store[idx])
-
-        return results
+        if self.embedding_cache is not None:
+            cached = self.embedding_cache.get(text)
+            if cached is not None:
+                return cached
+
+        emb = gateway.embed(model=EMBED_MODEL, input=text, deadline=EMBED_DEADLINE)
+        vector = np.array(emb.data[0].embedding, dtype="float32")
+
+        if self.embedding_cache is not None:
+            self.embedding_cache.set(text, vector)
+        return vector
+
+    async def aembed(self, text):
+        """Non-blocking embed(); the disk cache tier is read on SEARCH_POOL."""
+        loop = asyncio.get_running_loop()
+        if self.embedding_cache is not None:
+            cached = await loop.run_in_executor(SEARCH_POOL, self.embedding_cache.get, text)
+            if cached is not None:
+                return cached
+
+        key = f"{EMBED_MODEL}\x00{normalize_text(text)}"
+        return await embed_flight.do(key, self._aembed_uncached, text)
+
+    async def _aembed_uncached(self, text):
+        emb = await gateway.aembed(model=EMBED_MODEL, input=text, deadline=EMBED_DEADLINE)
+        vector = np.array(emb.data[0].embedding, dtype="float32")
+
+        if self.embedding_cache is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(SEARCH_POOL, self.embedding_cache.set, text, vector)
+        return vector
+
+    def _vector_ids(self, vector, k, allowed=None):
+        params = None
+        if allowed is not None:
+            if allowed.size <= EXACT_FILTER_MAX and self._can_reconstruct():
+                return self._exact_ids(vector, k, allowed)
+            # Filter inside FAISS: only ids in `allowed` are ever scored, and
+            # efSearch / nprobe grow with how selective the filter is
+            params = search_params(self.index_spec, faiss.IDSelectorBatch(allowed),
+                                   selectivity=allowed.size / max(self.index.ntotal, 1), k=k)
+        distances, indices = self.index.search(np.array([vector]), k, params=params)
+        return [int(idx) for idx in indices[0] if idx != -1]
+
+    def _can_reconstruct(self) -> bool:
+        """Whether stored vectors can be read back by id (IVF needs a direct map)."""
+        if self._reconstructable is None:
+            with self._reconstruct_lock:
+                if self._reconstructable is None:
+                    try:
+                        if self.index_spec and self.index_spec["type"] in ("ivf", "ivfpq"):
+                            faiss.extract_index_ivf(self.index).make_direct_map()
+                        self.index.reconstruct(0)
+                        self._reconstructable = True
+                    except RuntimeError as e:
+                        print(f"[RAG] index can't reconstruct vectors, filtered search stays approximate: {e}")
+                        self._reconstructable = False
+        return self._reconstructable
+
+    def _exact_ids(self, vector, k, allowed):
+        """Brute-force L2 ranking of the allowed vectors (same metric as the index)."""
+        vectors = self.index.reconstruct_batch(allowed)
+        distances = ((vectors - vector) ** 2).sum(axis=1)
+        order = np.argsort(distances, kind="stable")[:k]
+        return [int(allowed[i]) for i in order]
+
+    def _lexical_ids(self, query, k, allowed=None):
+        return [doc_id for doc_id, _ in self.lexical.search(query, k, allowed=allowed)]
+
+    def _retrieve(self, query, vector, k, mode, filters=None):
+        """CPU-only part of a search: filtering, FAISS / BM25 ranking and doc decoding."""
+        allowed = self.metadata.resolve(filters)
+        if allowed is not None and allowed.size == 0:
+            return []
+
+        if mode == "vector":
+            ids = self._vector_ids(vector, k, allowed)
+        elif mode == "lexical":
+            ids = self._lexical_ids(query, k, allowed)
+        else:
+            depth = k * CANDIDATES_PER_K
+            vector_ids = self._vector_ids(vector, depth, allowed) if vector is not None else []
+            ids = rrf_fuse(vector_ids, self._lexical_ids(query, depth, allowed), k=k)
+
+        return [self.store[idx] for idx in ids]
+
+    def search(self, query, k=5, mode="hybrid", filters=None):
+        """
+        mode="hybrid"  — vector + BM25 fused with reciprocal-rank fusion
+        mode="vector"  — embeddings only
+        mode="lexical" — BM25 only, no network call
+        Hybrid degrades to lexical if the embeddings call fails.
+
+        filters: {"country": ..., "category": ..., "source": ..., "lang": ...};
+        each value is a string or a list (OR), fields are combined with AND.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}'")
+        self.metadata.check(filters)   # before paying for an embedding
+
+        vector = None
+        if mode == "vector":
+            vector = self.embed(query)
+        elif mode == "hybrid":
+            try:
+                vector = self.embed(query)
+            except Exception as e:
+                print(f"[RAG] embedding failed, serving lexical results: {e}")
+
+        return self._retrieve(query, vector, k, mode, filters)
+
+    async def asearch(self, query, k=5, mode="hybrid", filters=None):
+        """search() for async handlers: awaits the embedding, runs FAISS on SEARCH_POOL."""
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}'")
+        self.metadata.check(filters)
+
+        vector = None
+        if mode == "vector":
+            vector = await self.aembed(query)
+        elif mode == "hybrid":
+            try:
+                vector = await self.aembed(query)
+            except Exception as e:
+                print(f"[RAG] embedding failed, serving lexical results: {e}")
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(SEARCH_POOL, self._retrieve, query, vector, k, mode, filters)
@@ -1,14 +1,17 @@
-from fastapi import APIRouter, HTTPException, Header, Depends
+from fastapi import APIRouter, HTTPException, Header, Depends, Request, Response
 import os
-import json
 from slugify import slugify
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
 
-# Absolute path to /data/blog directory
-BASE_DIR = os.path.dirname(os.path.dirname(__file__))
-BLOG_DIR = os.path.join(BASE_DIR, "data", "blog")
+from services.blog_catalog import BlogCatalog
+from services.blog_store import get_store
+from utils.http_cache import (
+    POST_CACHE_CONTROL, LIST_CACHE_CONTROL,
+    make_etag, not_modified, cache_headers, not_modified_response,
+)
+from utils.payload_cache import PayloadCache, negotiate
 
 router = APIRouter(prefix="/api/blog", tags=["Blogs"])
 
@@ -45,91 +48,113 @@ class BlogPost(BaseModel):
 # Utility: Load ONE blog
 # -----------------------------------------
 def load_blog(slug: str, lang: str = "fa"):
-    path = os.path.join(BLOG_DIR, slug, f"{lang}.json")
-    if not os.path.exists(path):
-        return None
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return store.get(slug, lang)
+
+
+# -----------------------------------------
+# Storage (SQLite, see services/blog_store.py) and the listing index:
+# loaded once, kept current by create_blog + a watcher
+# -----------------------------------------
+store = get_store()
+catalog = BlogCatalog(store)
+catalog.watch(float(os.getenv("BLOG_WATCH_INTERVAL", "5")))
+
+# Serialized + gzip/brotli response bodies, bounded by total bytes
+payloads = PayloadCache(max_bytes=int(float(os.getenv("BLOG_PAYLOAD_CACHE_MB", "64")) * 1024 * 1024))
+
+
+def cached_response(request: Request, key: tuple, headers: dict, encoding: str, build, mtime=None) -> Response:
+    """Serve `key` from the payload cache in the negotiated encoding (304 if the client is current)."""
+    headers = {**headers, "Vary": "Accept-Encoding"}
+    if not_modified(request, headers["ETag"], mtime):
+        return not_modified_response(headers)
+    body, content_encoding = payloads.get_or_build(key, build).get(encoding)
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 # -----------------------------------------
 # GET /api/blog/list
 # -----------------------------------------
 @router.get("/list")
-def list_blogs(page: int = 1, limit: int = 10, category: str | None = None, q: str | None = None, lang: str = "fa"):
-    blogs = []
-    if os.path.exists(BLOG_DIR):
-        for item in os.listdir(BLOG_DIR):
-            item_path = os.path.join(BLOG_DIR, item)
-            if not os.path.isdir(item_path):
-                continue
-            slug = item
-            data = load_blog(slug, lang=lang)
-            if not data:
-                continue
-            if category and data.get("category", "").lower() != category.lower():
-                continue
-            if q:
-                text = (data.get("title", "") + " " + data.get("meta_description", "")).lower()
-                if q.lower() not in text:
-                    continue
-            blogs.append({
-                "slug": slug,
-                "title": data.get("title", ""),
-                "meta_description": data.get("meta_description", ""),
-                "category": data.get("category", "General"),
-                "date": data.get("date", ""),
-                "image_url": data.get("image_url", ""),
-                "tags": data.get("tags", []),
-            })
-    blogs.sort(key=lambda x: x["date"], reverse=True)
-    total = len(blogs)
-    start = (page - 1) * limit
-    end = start + limit
-    return {
-        "page": page,
-        "limit": limit,
-        "total": total,
-        "pages": (total // limit) + (1 if total % limit else 0),
-        "blogs": blogs[start:end]
-    }
+def list_blogs(request: Request, page: int = 1, limit: int = 10, category: str | None = None,
+               q: str | None = None, lang: str = "fa", tag: str | None = None):
+    snapshot = catalog.lang(lang)
+    encoding = negotiate(request.headers.get("accept-encoding"))
+    params = (page, limit, category, tag, q)
+    # The response is a function of the listing content and the query; search
+    # results also depend on post bodies, which the listing version doesn't cover
+    version = (snapshot.version, catalog.search_version(lang) if q else "")
+    headers = cache_headers(
+        make_etag(*version, lang, *params, encoding),
+        snapshot.modified or None,
+        LIST_CACHE_CONTROL,
+    )
+
+    def build():
+        total, blogs = catalog.page(lang, page=page, limit=limit, category=category, tag=tag, q=q)
+        return {
+            "page": page,
+            "limit": limit,
+            "total": total,
+            "pages": (total // limit) + (1 if total % limit else 0),
+            "blogs": blogs
+        }
+
+    return cached_response(request, ("list", lang, *version, *params), headers, encoding, build,
+                           snapshot.modified or None)
+
+
+# -----------------------------------------
+# Conditional GET for one post: validators come from the catalog (a stat()
+# plus a cached content hash), so a 304 never opens the post file, and a
+# 200 for a hot post is served from the payload cache
+# -----------------------------------------
+def post_response(request: Request, slug: str, lang: str, variant: str, build):
+    validator = catalog.validator(slug, lang)
+    if validator is None:
+        raise HTTPException(status_code=404, detail=f"Blog '{slug}' not found")
+    content_hash, mtime = validator
+    encoding = negotiate(request.headers.get("accept-encoding"))
+    headers = cache_headers(make_etag(content_hash, variant, encoding), mtime, POST_CACHE_CONTROL)
+
+    def load():
+        data = load_blog(slug, lang=lang)
+        if not data:
+            raise HTTPException(status_code=404, detail=f"Blog '{slug}' not found")
+        return build(data)
+
+    return cached_response(request, (slug, lang, variant, content_hash), headers, encoding, load, mtime)
 
 
 # -----------------------------------------
 # GET /api/blog/{slug}
 # -----------------------------------------
 @router.get("/{slug}")
-def get_blog(slug: str, lang: str = "fa"):
+def get_blog(slug: str, request: Request, lang: str = "fa"):
     slug = slugify(slug)
-    data = load_blog(slug, lang=lang)
-    if not data:
-        raise HTTPException(status_code=404, detail=f"Blog '{slug}' not found")
-    data["slug"] = slug
-    return data
+    return post_response(request, slug, lang, "post", lambda data: {**data, "slug": slug})
 
 
 # -----------------------------------------
 # GET /api/blog/html/{slug}
 # -----------------------------------------
 @router.get("/html/{slug}")
-def get_blog_html(slug: str, lang: str = "fa"):
+def get_blog_html(slug: str, request: Request, lang: str = "fa"):
     slug = slugify(slug)
-    data = load_blog(slug, lang=lang)
-    if not data:
-        raise HTTPException(status_code=404, detail=f"Blog '{slug}' not found")
-    return {"slug": slug, "html": data.get("content_html", "")}
+    return post_response(request, slug, lang, "html",
+                         lambda data: {"slug": slug, "html": data.get("content_html", "")})
 
 
 # -----------------------------------------
 # GET /api/blog/toc/{slug}
 # -----------------------------------------
 @router.get("/toc/{slug}")
-def get_blog_toc(slug: str, lang: str = "fa"):
+def get_blog_toc(slug: str, request: Request, lang: str = "fa"):
     slug = slugify(slug)
-    data = load_blog(slug, lang=lang)
-    if not data:
-        raise HTTPException(status_code=404, detail=f"Blog '{slug}' not found")
-    return {"slug": slug, "toc": data.get("outline", [])}
+    return post_response(request, slug, lang, "toc",
+                         lambda data: {"slug": slug, "toc": data.get("outline", [])})
 
 
 # -----------------------------------------
@@ -138,7 +163,7 @@ def get_blog_toc(slug: str, lang: str = "fa"):
 @router.post("/create", dependencies=[Depends(verify_bot_secret)])
 def create_blog(post: BlogPost):
     """
-    Create a new blog post by writing it to data/blog/{slug}/{lang}.json.
+    Create a new blog post in the blog store.
     Protected by X-Bot-Secret header.
     """
     slug = slugify(post.slug)
@@ -146,15 +171,6 @@ def create_blog(post: BlogPost):
     # Auto-set date if not provided
     date = post.date or datetime.utcnow().strftime("%Y-%m-%d")
 
-    # Build the post directory
-    post_dir = os.path.join(BLOG_DIR, slug)
-    os.makedirs(post_dir, exist_ok=True)
-
-    # Check if post already exists
-    post_path = os.path.join(post_dir, f"{post.lang}.json")
-    if os.path.exists(post_path):
-        raise HTTPException(status_code=409, detail=f"Blog '{slug}' already exists for lang '{post.lang}'")
-
     # Build the JSON payload
     payload = {
         "title": post.title,
@@ -169,13 +185,16 @@ def create_blog(post: BlogPost):
         "slug": slug,
     }
 
-    with open(post_path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+    # Insert-if-absent is atomic, so two concurrent publishes can't both win
+    if store.put(slug, post.lang, payload, overwrite=False) is None:
+        raise HTTPException(status_code=409, detail=f"Blog '{slug}' already exists for lang '{post.lang}'")
+    catalog.upsert(slug, post.lang, payload)
+    payloads.invalidate((slug, post.lang))
+    payloads.invalidate(("list", post.lang))
 
     return {
         "success": True,
         "slug": slug,
         "lang": post.lang,
-        "path": post_path,
         "message": f"Blog post '{slug}' published successfully."
     }
\ No newline at end of file
@@ -1,27 +1,72 @@
 import os
-from fastapi import APIRouter
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from rag.search_engine import RAGSearchEngine
-from ai.openai_client import ai_suggest, ai_chat
+from rag.search_engine import RAGSearchEngine, EMBED_MODEL, embed_flight
+from rag.embedding_cache import QueryEmbeddingCache
+from rag.embedding_store import EmbeddingStore
+from rag.registry import EngineRegistry
+from rag.filters import UnsupportedFilter
+from routers.blog import verify_bot_secret, payloads as blog_payloads, catalog as blog_catalog
+from services.suggestion_jobs import SuggestionJobs
+from services.chat_sessions import ChatSessionStore
+from ai import gateway
+from ai.prompts import prompt_cache_stats
+from utils.sse import SSE_HEADERS, sse_chat_stream, sse_event
+from utils.singleflight import SingleFlight
+from utils.text import normalize_text
+from ai.openai_client import ai_suggest_async, ai_chat_async, ai_chat_stream, summarize_history
+from ai.answer_cache import SemanticAnswerCache, doc_signature
 import json
 
 router = APIRouter()
 
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # backend/
 
-engine = RAGSearchEngine(
-    index_path=os.path.join(BASE_DIR, "rag", "faiss_index.bin"),
-    store_path=os.path.join(BASE_DIR, "rag", "store.json")
+# Query embedding cache: in-process LRU + on-disk store shared by workers
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(BASE_DIR, "rag", "query_embeddings.db"))
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "2048"))
+# Disk tier bounds: ~6 KB per vector, so 20000 rows is ~120 MB
+EMBED_CACHE_DISK_ROWS = int(os.getenv("EMBED_CACHE_DISK_ROWS", "20000"))
+EMBED_CACHE_DISK_TTL = float(os.getenv("EMBED_CACHE_DISK_TTL", str(30 * 86400)))
+
+embedding_cache = QueryEmbeddingCache(
+    store=EmbeddingStore(EMBED_CACHE_PATH),
+    maxsize=EMBED_CACHE_SIZE,
+    model=EMBED_MODEL,
+    disk_max_rows=EMBED_CACHE_DISK_ROWS,
+    disk_max_age=EMBED_CACHE_DISK_TTL,
 )
 
-@router.get("/search")
-async def search(q: str):
-    results = engine.search(q, k=5)
+# Live engine; swapped atomically when build_index publishes a new version
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "5"))
 
-    # ---- AI SUGGESTIONS ----
-    raw_ai = ai_suggest(q, results)
+registry = EngineRegistry(
+    lambda index_path, store_path: RAGSearchEngine(
+        index_path=index_path,
+        store_path=store_path,
+        embedding_cache=embedding_cache,
+    )
+)
+registry.watch(INDEX_WATCH_INTERVAL)
+
+# hybrid (vector + BM25), vector, or lexical (no embedding call)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")
+
+# AI suggestions reused for near-identical queries that retrieved the same docs
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    maxsize=int(os.getenv("ANSWER_CACHE_SIZE", "1024")),
+)
 
-    # Try to clean and parse JSON from AI output safely
+
+def parse_ai_output(raw_ai):
+    """
+    Clean and parse the JSON from ai_suggest output.
+    Returns (ai_output, parsed_ok).
+    """
     ai_output = {"suggestions": [], "summary": ""}
 
     if raw_ai and isinstance(raw_ai, str):
@@ -35,7 +80,7 @@ async def search(q: str):
                 cleaned = cleaned[idx:]
 
         try:
-            ai_output = json.loads(cleaned)
+            return json.loads(cleaned), True
         except:
             # fallback: return plain text
             ai_output = {
@@ -43,20 +88,211 @@ async def search(q: str):
                 "summary": cleaned
             }
 
+    return ai_output, False
+
+
+# Deferred AI suggestions for two-phase search (?defer_ai=true)
+suggestion_jobs = SuggestionJobs(
+    os.getenv("SUGGESTION_JOBS_PATH", os.path.join(BASE_DIR, "rag", "suggestion_jobs.db")),
+    ttl=float(os.getenv("SUGGESTION_TICKET_TTL", "300")),
+)
+
+
+# A burst of identical searches (e.g. a shared blog link) makes one LLM call
+suggest_flight = SingleFlight("ai_suggest")
+
+
+async def _suggest_uncached(q, results, vector):
+    raw_ai = await ai_suggest_async(q, results)
+    ai_output, parsed = parse_ai_output(raw_ai)
+    if parsed and vector is not None:
+        answer_cache.set(vector, results, ai_output)
+    return ai_output
+
+
+async def generate_suggestions(q, results, vector):
+    key = (normalize_text(q), doc_signature(results))
+    return await suggest_flight.do(key, _suggest_uncached, q, results, vector)
+
+
+def search_filters(country=None, category=None, source=None, lang=None):
+    """Query-string filters ("work,study" = either) -> engine filter dict."""
+    raw = {"country": country, "category": category, "source": source, "lang": lang}
+    return {
+        field: [v.strip() for v in value.split(",") if v.strip()]
+        for field, value in raw.items() if value
+    }
+
+
+@router.get("/search")
+async def search(
+    q: str,
+    mode: Literal["hybrid", "vector", "lexical"] = SEARCH_MODE,
+    defer_ai: bool = False,
+    country: Optional[str] = None,
+    category: Optional[str] = None,
+    source: Optional[str] = None,
+    lang: Optional[str] = None,
+):
+    """
+    defer_ai=false — wait for AI suggestions and return them in "ai".
+    defer_ai=true  — return the retrieved docs right away with an "ai_ticket";
+                     fetch suggestions from /api/search/suggestions/{ticket}.
+    country / category / source / lang restrict retrieval (comma = any of).
+    """
+    engine = registry.engine
+    filters = search_filters(country, category, source, lang)
+    try:
+        results = await engine.asearch(q, k=5, mode=mode, filters=filters)
+    except UnsupportedFilter as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # ---- AI SUGGESTIONS ----
+    # The query vector is already in the embedding cache from asearch();
+    # it is absent in lexical mode or when the embedding call failed.
+    vector = embedding_cache.peek(q) if mode != "lexical" else None
+    ai_output = answer_cache.get(vector, results) if vector is not None else None
+
+    if ai_output is not None or not defer_ai:
+        if ai_output is None:
+            ai_output = await generate_suggestions(q, results, vector)
+        return {
+            "query": q,
+            "results": results,
+            "ai": ai_output
+        }
+
+    # Phase 2 reuses these docs and vector — no second embedding or search
+    ticket = await suggestion_jobs.submit(generate_suggestions(q, results, vector))
     return {
         "query": q,
         "results": results,
-        "ai": ai_output
+        "ai": None,
+        "ai_ticket": ticket,
+    }
+
+
+@router.get("/search/suggestions/{ticket}")
+async def search_suggestions(ticket: str, wait: float = 0):
+    """Deferred AI suggestions; `wait` long-polls up to that many seconds (max 30)."""
+    job = await suggestion_jobs.get(ticket, wait=min(max(wait, 0), 30))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired ticket")
+    return {"ticket": ticket, **job}
+
+
+@router.get("/search/suggestions/{ticket}/stream")
+async def search_suggestions_stream(ticket: str):
+    """SSE variant: a single `suggestions` event (or `error`) once the job finishes."""
+    async def events():
+        job = await suggestion_jobs.get(ticket, wait=60)
+        if job is None:
+            yield sse_event("error", {"detail": "Unknown or expired ticket"})
+        elif job["status"] == "ready":
+            yield sse_event("suggestions", {"ticket": ticket, "ai": job["ai"]})
+        else:
+            yield sse_event("error", {"detail": f"Suggestions {job['status']}"})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.get("/search/filters")
+def search_filter_values():
+    """Filter values available in the live index, with document counts."""
+    return registry.engine.metadata.values()
+
+
+@router.get("/search/stats")
+def search_stats():
+    return {
+        "index": registry.info(),
+        "embedding_cache": embedding_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "single_flight": {
+            "embeddings": embed_flight.stats(),
+            "ai_suggest": suggest_flight.stats(),
+        },
+        "chat_sessions": chat_sessions.stats(),
+        "prompt_cache": prompt_cache_stats(),
+        "llm_gateway": gateway.stats(),
+        "blog_payload_cache": blog_payloads.stats(),
+        "blog_catalog": blog_catalog.stats(),
     }
 
 
+@router.post("/admin/reload-index", dependencies=[Depends(verify_bot_secret)])
+def reload_index(force: bool = False):
+    """Load the version named in rag/indexes/manifest.json in this worker."""
+    return registry.reload(force=force)
+
+
+# Server-side chat history; set CHAT_SESSIONS_DB to persist across restarts/workers
+chat_sessions = ChatSessionStore(
+    ttl=float(os.getenv("CHAT_SESSION_TTL", str(6 * 3600))),
+    history_tokens=int(os.getenv("CHAT_HISTORY_TOKENS", "1200")),
+    db_path=os.getenv("CHAT_SESSIONS_DB") or None,
+)
+
+
 class ChatRequest(BaseModel):
     message: str
-    history: list = []   # [{"role": "user"|"assistant", "content": "..."}]
+    session_id: Optional[str] = None   # server-side history; replaces `history`
+    new_session: bool = False          # start a server-side session (its id comes back in the reply)
+    history: list = []   # [{"role": "user"|"assistant", "content": "..."}] (legacy clients)
+
+
+async def open_session(req: ChatRequest):
+    if not req.session_id and not req.new_session:
+        # Client keeping its own history (possibly empty on its first turn):
+        # use it as before and store nothing
+        return chat_sessions.ephemeral(
+            [{"role": t["role"], "content": t["content"]} for t in req.history]
+        )
+    return await chat_sessions.get_or_create(req.session_id)
+
+
+async def finish_turn(session, message, reply):
+    await chat_sessions.add_turn(session, message, reply)
+    chat_sessions.compact_in_background(session, summarize_history)
 
 
-@router.post("/chat")
+# Named rag_chat so they don't collide with main.py's /api/chat and /api/chat/stream
+@router.post("/rag_chat")
 async def chat(req: ChatRequest):
-    docs = engine.search(req.message, k=5)
-    reply = ai_chat(req.message, docs, history=req.history)
-    return {"reply": reply}
+    engine = registry.engine
+    session = await open_session(req)
+    docs = await engine.asearch(req.message, k=5, mode=SEARCH_MODE)
+    reply = await ai_chat_async(req.message, docs, history=session.turns, summary=session.summary)
+    await finish_turn(session, req.message, reply)
+    return {"reply": reply, "session_id": session.id if session.persistent else None}
+
+
+@router.post("/rag_chat/stream")
+async def chat_stream(req: ChatRequest):
+    """RAG chat streamed over SSE; the final `done` event lists the sources used."""
+    engine = registry.engine
+    session = await open_session(req)
+    docs = await engine.asearch(req.message, k=5, mode=SEARCH_MODE)
+    sources = [{"title": d.get("title", ""), "source": d.get("source", "")} for d in docs]
+
+    async def recorded(events):
+        parts = []
+        async for item in events:
+            if item["type"] == "token":
+                parts.append(item["content"])
+            yield item
+        await finish_turn(session, req.message, "".join(parts))
+
+    events = ai_chat_stream(req.message, docs, history=session.turns, summary=session.summary)
+    return StreamingResponse(
+        sse_chat_stream(recorded(events), sources, meta={"session_id": session.id if session.persistent else None}),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+@router.delete("/chat/session/{session_id}")
+def delete_chat_session(session_id: str):
+    """Forget a conversation (e.g. the user pressed "new chat")."""
+    chat_sessions.delete(session_id)
+    return {"deleted": session_id}
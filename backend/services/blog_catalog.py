@@ -0,0 +1,181 @@
+"""
+Blog Catalog
+============
+In-memory index of the blog listing, one per language.
+
+Holds only the listing fields of each post (never content_html), pre-sorted
+newest first, plus category and tag posting lists into that order. Listing,
+filtering by category/tag and pagination are then a slice of a list, without
+touching the disk.
+
+Loaded once from the blog store (services/blog_store.py). create_blog()
+calls upsert() after storing a post, and a watcher thread reloads when
+another connection commits to the database (another worker publishing, a
+migration run).
+Each language is an immutable snapshot that is swapped on change, so
+readers never need a lock.
+
+It also hands out HTTP validators: the stored content hash and update time
+of a post (one indexed lookup) and a content-derived version per language
+listing, so conditional GETs are answered without loading posts.
+
+Queries with `q` go to a full-text BlogSearchIndex per language
+(services/blog_search.py), kept in step with the listing by reload() and
+upsert(); those results come back in relevance order with a snippet.
+"""
+
+import json
+import time
+import hashlib
+import threading
+
+from services.blog_search import BlogSearchIndex
+
+
+def listing_entry(slug: str, data: dict) -> dict:
+    return {
+        "slug": slug,
+        "title": data.get("title", ""),
+        "meta_description": data.get("meta_description", ""),
+        "category": data.get("category", "General"),
+        "date": data.get("date", ""),
+        "image_url": data.get("image_url", ""),
+        "tags": data.get("tags", []),
+    }
+
+
+class LangCatalog:
+    """Immutable listing snapshot for one language."""
+
+    def __init__(self, entries: dict, modified: float = 0.0):
+        self.by_slug = entries
+        self.modified = modified   # newest post file mtime (Last-Modified of the listing)
+        # Newest first; slug breaks ties so the order is stable across reloads
+        ordered = sorted(entries.values(), key=lambda e: e["slug"])
+        self.entries = sorted(ordered, key=lambda e: e["date"], reverse=True)
+        self.by_category = {}
+        self.by_tag = {}
+        for i, entry in enumerate(self.entries):
+            self.by_category.setdefault(entry["category"].lower(), []).append(i)
+            for tag in entry["tags"] or []:
+                self.by_tag.setdefault(str(tag).lower(), []).append(i)
+        # Same listing content => same version, in every worker and after restarts
+        self.version = hashlib.sha256(
+            json.dumps(self.entries, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:16]
+
+    def with_entry(self, entry: dict, modified: float) -> "LangCatalog":
+        return LangCatalog({**self.by_slug, entry["slug"]: entry}, max(self.modified, modified))
+
+    def select(self, category: str = None, tag: str = None) -> list:
+        """Positions (newest first) matching the filters."""
+        ids = None
+        if category:
+            ids = self.by_category.get(category.lower(), [])
+        if tag:
+            tagged = self.by_tag.get(tag.lower(), [])
+            ids = tagged if ids is None else sorted(set(ids).intersection(tagged))
+        return range(len(self.entries)) if ids is None else ids
+
+
+class BlogCatalog:
+    def __init__(self, store):
+        self.store = store      # BlogStore
+        self._langs = {}        # lang -> LangCatalog
+        self._search = {}       # lang -> BlogSearchIndex
+        self._lock = threading.Lock()   # serializes writers only
+        self._signature = None
+        self._watcher = None
+        self.loaded_at = 0.0
+        self.reload()
+
+    # ── loading ─────────────────────────────────────────────────────────────
+
+    def reload(self) -> None:
+        # Read under the writer lock: an upsert() committed meanwhile is then
+        # either in this snapshot or applied after it, never overwritten
+        with self._lock:
+            signature = self.store.signature()
+            langs, modified, search = {}, {}, {}
+            for slug, lang, data, content_hash, updated_at in self.store.posts():
+                langs.setdefault(lang, {})[slug] = listing_entry(slug, data)
+                modified[lang] = max(modified.get(lang, 0.0), updated_at)
+                search.setdefault(lang, BlogSearchIndex()).upsert(slug, data, content_hash)
+            self._langs = {lang: LangCatalog(entries, modified[lang]) for lang, entries in langs.items()}
+            self._search = search
+            self._signature = signature
+            self.loaded_at = time.time()
+
+    def upsert(self, slug: str, lang: str, data: dict) -> None:
+        """Add or replace one post after it has been stored."""
+        content_hash, updated_at = self.store.validator(slug, lang)
+        with self._lock:
+            current = self._langs.get(lang) or LangCatalog({})
+            entry = listing_entry(slug, data)
+            self._langs = {**self._langs, lang: current.with_entry(entry, updated_at)}
+            index = self._search.get(lang)
+            if index is None:
+                index = self._search[lang] = BlogSearchIndex()
+            index.upsert(slug, data, content_hash)
+
+    def validator(self, slug: str, lang: str):
+        """(content hash, updated_at) of a post, or None if it doesn't exist."""
+        return self.store.validator(slug, lang)
+
+    def watch(self, interval: float = 5.0) -> None:
+        """Reload in a daemon thread when another connection changes the store."""
+        if self._watcher is not None or interval <= 0:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.store.signature() != self._signature:
+                        self.reload()
+                except Exception as e:
+                    print(f"[blog] catalog reload failed: {e}")
+
+        self._watcher = threading.Thread(target=loop, name="blog-watcher", daemon=True)
+        self._watcher.start()
+
+    # ── queries ─────────────────────────────────────────────────────────────
+
+    def lang(self, lang: str) -> LangCatalog:
+        return self._langs.get(lang) or LangCatalog({})
+
+    def search_version(self, lang: str) -> str:
+        """Content version of the search index (covers post bodies, unlike LangCatalog.version)."""
+        index = self._search.get(lang)
+        return index.version if index is not None else ""
+
+    def page(self, lang: str, page: int = 1, limit: int = 10, category: str = None, tag: str = None, q: str = None):
+        """(total, entries on `page`) for the listing endpoint."""
+        catalog = self.lang(lang)
+        ids = catalog.select(category, tag)
+        start = max(0, (page - 1) * limit)
+        if q:
+            return self._search_page(catalog, lang, q, ids if (category or tag) else None, start, limit)
+        return len(ids), [catalog.entries[i] for i in ids[start:start + limit]]
+
+    def _search_page(self, catalog: LangCatalog, lang: str, q: str, ids, start: int, limit: int):
+        index = self._search.get(lang)
+        if index is None:
+            return 0, []
+        allowed = None if ids is None else {catalog.entries[i]["slug"] for i in ids}
+        total, ranked = index.search(q, allowed, limit=start + limit)
+        results = []
+        for slug, score in ranked[start:]:
+            entry = catalog.by_slug.get(slug)
+            if entry is not None:
+                results.append({**entry, "score": round(score, 3), "snippet": index.snippet(slug, q)})
+        return total, results
+
+    def stats(self) -> dict:
+        return {
+            "languages": {lang: len(c.entries) for lang, c in self._langs.items()},
+            "search_terms": {lang: len(index.postings) for lang, index in self._search.items()},
+            "store": self.store.stats(),
+            "loaded_at": self.loaded_at,
+            "watching": self._watcher is not None,
+        }
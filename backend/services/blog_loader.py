@@ -1,49 +1,26 @@
-import os
-import json
-
-BLOG_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "blog")
+from services.blog_store import get_store
 
 
 def load_all_blog_posts(lang: str = "en"):
     """
-    Load all blog posts from the slug/lang.json structure.
+    Load all blog posts of a language from the blog store.
     
     Args:
         lang: Language code (default: "en")
     
     Returns:
-        list: Sorted list of blog posts
+        list: Blog posts, newest first
     """
-    posts = []
-    
-    if not os.path.exists(BLOG_DIR):
-        return posts
-
-    for item in os.listdir(BLOG_DIR):
-        item_path = os.path.join(BLOG_DIR, item)
-        # Skip files and special directories
-        if not os.path.isdir(item_path) or item in ["processed", "images"]:
-            continue
-        
-        slug = item
-        lang_file = os.path.join(item_path, f"{lang}.json")
-        
-        if os.path.exists(lang_file):
-            try:
-                with open(lang_file, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                
-                posts.append({
-                    "id": slug,
-                    "title": data.get("title"),
-                    "date": data.get("date"),
-                    "category": data.get("category"),
-                    "meta_description": data.get("meta_description"),
-                })
-            except Exception:
-                continue
-
-    return sorted(posts, key=lambda x: x.get("date", ""), reverse=True)
+    return [
+        {
+            "id": row["slug"],
+            "title": row["title"],
+            "date": row["date"],
+            "category": row["category"],
+            "meta_description": row["meta_description"],
+        }
+        for row in get_store().listing(lang)
+    ]
 
 
 def load_blog_post(post_id: str, lang: str = "en"):
@@ -57,10 +34,4 @@ def load_blog_post(post_id: str, lang: str = "en"):
     Returns:
         dict or None: Blog data or None if not found
     """
-    path = os.path.join(BLOG_DIR, post_id, f"{lang}.json")
-
-    if not os.path.exists(path):
-        return None
-
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return get_store().get(post_id, lang)
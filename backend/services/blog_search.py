@@ -0,0 +1,202 @@
+"""
+Blog Search
+===========
+Full-text search over the blog, one index per language.
+
+An inverted index (term -> {slug: weighted term frequency}) over a post's
+title, tags, meta description and body text (content_html with the markup
+stripped). Terms come from utils.text.tokenize, so Persian/Arabic letter
+variants, ZWNJ, diacritics and digits match however they were typed.
+Fields are weighted by counting their terms several times (a title hit
+outweighs a body hit), and documents are ranked with BM25 using the same
+parameters as rag/lexical.py.
+
+The index is mutable: BlogCatalog upserts a post when it is published and
+rebuilds everything on reload. A query only touches the posting lists of
+its own terms, so its cost depends on how many posts contain those terms,
+not on the size of the blog.
+
+Results carry a snippet: the window of body text holding most of the query
+terms, HTML-escaped, with matches wrapped in <mark>.
+"""
+
+import re
+import html
+import math
+import heapq
+import itertools
+import hashlib
+import threading
+
+from rag.lexical import BM25_K1, BM25_B
+from utils.text import tokenize, term_pattern
+
+# How many times each field's terms are counted
+FIELD_WEIGHTS = {"title": 3, "tags": 2, "meta_description": 2, "body": 1}
+SNIPPET_CHARS = 180
+
+_TAG = re.compile(r"<(script|style)\b.*?</\1\s*>|<[^>]+>", re.S | re.I)
+_SPACE = re.compile(r"\s+")
+
+
+def strip_html(content_html: str) -> str:
+    """Visible text of a post body."""
+    text = html.unescape(_TAG.sub(" ", content_html or ""))
+    return _SPACE.sub(" ", text).strip()
+
+
+def _fields(data: dict) -> dict:
+    return {
+        "title": data.get("title", ""),
+        "tags": " ".join(str(t) for t in data.get("tags") or []),
+        "meta_description": data.get("meta_description", ""),
+        "body": strip_html(data.get("content_html", "")),
+    }
+
+
+class BlogSearchIndex:
+    def __init__(self):
+        self.postings = {}     # term -> {slug: weighted tf}
+        self.doc_terms = {}    # slug -> {term: weighted tf}, to unindex on update
+        self.doc_len = {}      # slug -> weighted length
+        self.texts = {}        # slug -> (meta description, body text) for snippets
+        self.hashes = {}       # slug -> content hash
+        self.total_len = 0
+        self._norms = None     # slug -> BM25 length normalization, rebuilt lazily
+        self._version = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    # ── updates ─────────────────────────────────────────────────────────────
+
+    def upsert(self, slug: str, data: dict, content_hash: str = "") -> None:
+        fields = _fields(data)
+        terms = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(fields[field]):
+                terms[token] = terms.get(token, 0) + weight
+        with self._lock:
+            self._unindex(slug)
+            for term, tf in terms.items():
+                self.postings.setdefault(term, {})[slug] = tf
+            self.doc_terms[slug] = terms
+            self.doc_len[slug] = sum(terms.values())
+            self.total_len += self.doc_len[slug]
+            self.texts[slug] = (fields["meta_description"], fields["body"])
+            self.hashes[slug] = content_hash
+            self._norms = None
+            self._version = None
+
+    def _unindex(self, slug: str) -> None:
+        for term in self.doc_terms.pop(slug, {}):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(slug, None)
+                if not posting:
+                    del self.postings[term]
+        self.total_len -= self.doc_len.pop(slug, 0)
+        self.texts.pop(slug, None)
+        self.hashes.pop(slug, None)
+
+    @property
+    def version(self) -> str:
+        """Changes whenever any indexed post does (part of search ETags)."""
+        # Computed and cached under the lock, so an upsert() can't be undone
+        # by a hash of the hashes from before it
+        with self._lock:
+            if self._version is None:
+                joined = "\n".join(f"{s}:{h}" for s, h in sorted(self.hashes.items()))
+                self._version = hashlib.sha256(joined.encode("utf-8")).hexdigest()[:16]
+            return self._version
+
+    # ── queries ─────────────────────────────────────────────────────────────
+
+    def _length_norms(self) -> dict:
+        with self._lock:
+            if self._norms is None:
+                avg = self.total_len / len(self.doc_len) if self.doc_len else 1.0
+                self._norms = {slug: BM25_K1 * (1 - BM25_B + BM25_B * n / (avg or 1.0))
+                               for slug, n in self.doc_len.items()}
+            return self._norms
+
+    def search(self, query: str, allowed: set = None, limit: int = None) -> tuple:
+        """
+        (number of matching posts, [(slug, score)] best first). `allowed`
+        restricts matches to a set of slugs (category/tag filters); `limit`
+        bounds how many ranked results are returned.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return 0, []
+        norms = self._length_norms()
+        n = len(self.doc_len)
+        scores = {}
+        for term in terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for slug, tf in list(posting.items()):
+                if allowed is not None and slug not in allowed:
+                    continue
+                norm = norms.get(slug)
+                if norm is None:   # indexed after the norms were computed
+                    continue
+                scores[slug] = scores.get(slug, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        # Ties broken by slug so pages don't shuffle between requests
+        key = lambda item: (item[1], item[0])
+        if limit is None or limit >= len(scores):
+            ranked = sorted(scores.items(), key=key, reverse=True)
+        else:
+            ranked = heapq.nlargest(limit, scores.items(), key=key)
+        return len(scores), ranked
+
+    def snippet(self, slug: str, query: str, width: int = SNIPPET_CHARS) -> str:
+        """Highlighted excerpt of the post around the query terms."""
+        meta, body = self.texts.get(slug, ("", ""))
+        pattern = _query_pattern(query)
+        if pattern is None:
+            return html.escape(meta)
+        matches = list(itertools.islice(pattern.finditer(body), 64))
+        if not matches:
+            return _highlight(meta, pattern) if meta else html.escape(body[:width])
+
+        # Window starting at a match that covers the most distinct terms
+        best, best_terms = 0, 0
+        for i, m in enumerate(matches):
+            end = m.start() + width
+            seen = {x.group(0).casefold() for x in matches[i:] if x.end() <= end}
+            if len(seen) > best_terms:
+                best, best_terms = i, len(seen)
+        start = matches[best].start()
+        # Lead in with a little context, snapped to a word boundary
+        start = max(0, start - width // 4)
+        if start:
+            space = body.find(" ", start)
+            start = space + 1 if 0 <= space < matches[best].start() else start
+        end = min(len(body), start + width)
+        if end < len(body):
+            space = body.rfind(" ", start, end)
+            end = space if space > matches[best].end() else end
+        text = _highlight(body[start:end], pattern)
+        return ("… " if start else "") + text + (" …" if end < len(body) else "")
+
+
+def _query_pattern(query: str):
+    tokens = sorted(set(tokenize(query)), key=len, reverse=True)
+    if not tokens:
+        return None
+    alternatives = "|".join(term_pattern(t) for t in tokens)
+    return re.compile(rf"(?<!\w)(?:{alternatives})(?!\w)", re.I)
+
+
+def _highlight(text: str, pattern) -> str:
+    out, last = [], 0
+    for m in pattern.finditer(text):
+        out.append(html.escape(text[last:m.start()]))
+        out.append(f"<mark>{html.escape(m.group(0))}</mark>")
+        last = m.end()
+    out.append(html.escape(text[last:]))
+    return "".join(out)
@@ -0,0 +1,244 @@
+"""
+Blog Store
+==========
+Embedded SQLite database holding every blog post, replacing the
+data/blog/<slug>/<lang>.json directory tree.
+
+One row per (slug, lang) with the full post as JSON plus indexed columns
+(lang, date, category; tags in their own table) for queries against the
+database itself, a content hash and an update time (HTTP validators). The
+API's category/tag filtering is served from memory by BlogCatalog. WAL mode lets
+every worker read while one publishes, and a publish is a single
+transaction, so readers never see a half-written post.
+
+All blog readers go through get_store(): the blog router and its catalog,
+services/blog_loader.py and linker.load_existing_posts.
+
+data/blog/<slug>/<lang>.json is now an import source only; the API never
+writes there. Every process start (get_store()) imports files that are new,
+or newer than the stored post, so dropping a JSON file into data/blog and
+deploying still publishes it. To import without a restart (running workers
+pick the change up through their catalog watcher):
+    python -m services.blog_store                 # new / changed files only
+    python -m services.blog_store --overwrite     # re-import every file
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+
+from utils.sqlite import connect
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+BLOG_DB = os.getenv("BLOG_DB", os.path.join(BASE_DIR, "data", "blog.db"))
+LEGACY_BLOG_DIR = os.path.join(BASE_DIR, "data", "blog")
+SKIP_DIRS = {"images", "processed"}
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS posts ("
+    "  slug             TEXT NOT NULL,"
+    "  lang             TEXT NOT NULL,"
+    "  title            TEXT NOT NULL DEFAULT '',"
+    "  meta_description TEXT NOT NULL DEFAULT '',"
+    "  category         TEXT NOT NULL DEFAULT 'General',"
+    "  date             TEXT NOT NULL DEFAULT '',"
+    "  data             TEXT NOT NULL,"
+    "  content_hash     TEXT NOT NULL,"
+    "  updated_at       REAL NOT NULL,"
+    "  PRIMARY KEY (slug, lang)"
+    ")",
+    "CREATE INDEX IF NOT EXISTS posts_lang_date ON posts (lang, date DESC, slug)",
+    "CREATE INDEX IF NOT EXISTS posts_lang_category ON posts (lang, category COLLATE NOCASE)",
+    "CREATE TABLE IF NOT EXISTS post_tags ("
+    "  slug TEXT NOT NULL,"
+    "  lang TEXT NOT NULL,"
+    "  tag  TEXT NOT NULL COLLATE NOCASE,"
+    "  PRIMARY KEY (slug, lang, tag)"
+    ")",
+    "CREATE INDEX IF NOT EXISTS post_tags_lang_tag ON post_tags (lang, tag)",
+)
+
+
+def content_hash(data: dict) -> str:
+    """Hash of a post's content (key order doesn't matter)."""
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()[:32]
+
+
+class BlogStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect(path, _SCHEMA)
+
+    # ── reads ───────────────────────────────────────────────────────────────
+
+    def get(self, slug: str, lang: str):
+        """Full post dict, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM posts WHERE slug = ? AND lang = ?", (slug, lang)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def validator(self, slug: str, lang: str):
+        """(content hash, updated_at) of a post, or None — without loading it."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash, updated_at FROM posts WHERE slug = ? AND lang = ?", (slug, lang)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def listing(self, lang: str) -> list:
+        """Listing columns of a language's posts, newest first (served from the (lang, date) index)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT slug, title, meta_description, category, date FROM posts "
+                "WHERE lang = ? ORDER BY date DESC, slug", (lang,)
+            ).fetchall()
+        return [
+            {"slug": r[0], "title": r[1], "meta_description": r[2], "category": r[3], "date": r[4]}
+            for r in rows
+        ]
+
+    def posts(self, lang: str = None) -> list:
+        """[(slug, lang, data, content_hash, updated_at)] ordered by slug, for full scans."""
+        sql = "SELECT slug, lang, data, content_hash, updated_at FROM posts"
+        args = ()
+        if lang is not None:
+            sql += " WHERE lang = ?"
+            args = (lang,)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY slug, lang", args).fetchall()
+        return [(slug, lang, json.loads(data), h, t) for slug, lang, data, h, t in rows]
+
+    def signature(self) -> int:
+        """Changes whenever ANOTHER connection (worker, migration run) commits."""
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    def updated_times(self) -> dict:
+        """{(slug, lang): updated_at} for every post."""
+        with self._lock:
+            rows = self._conn.execute("SELECT slug, lang, updated_at FROM posts").fetchall()
+        return {(slug, lang): t for slug, lang, t in rows}
+
+    # ── writes ──────────────────────────────────────────────────────────────
+
+    def _write(self, slug: str, lang: str, data: dict, updated_at: float, overwrite: bool):
+        h = content_hash(data)
+        verb = "INSERT OR REPLACE" if overwrite else "INSERT OR IGNORE"
+        cursor = self._conn.execute(
+            f"{verb} INTO posts (slug, lang, title, meta_description, category, date, data, content_hash, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (slug, lang, data.get("title") or "", data.get("meta_description") or "",
+             data.get("category") or "General", data.get("date") or "",
+             json.dumps(data, ensure_ascii=False), h, updated_at or time.time()),
+        )
+        if cursor.rowcount == 0:   # INSERT OR IGNORE hit an existing post
+            return None
+        self._conn.execute("DELETE FROM post_tags WHERE slug = ? AND lang = ?", (slug, lang))
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO post_tags (slug, lang, tag) VALUES (?, ?, ?)",
+            [(slug, lang, str(t)) for t in data.get("tags") or []],
+        )
+        return h
+
+    def put(self, slug: str, lang: str, data: dict, updated_at: float = None, overwrite: bool = True):
+        """
+        Store a post in one transaction. Returns its content hash, or None when
+        `overwrite` is False and the post already exists.
+        """
+        with self._lock, self._conn:
+            return self._write(slug, lang, data, updated_at, overwrite)
+
+    def put_many(self, items, overwrite: bool = True) -> int:
+        """Store (slug, lang, data, updated_at) tuples in one transaction. Returns posts written."""
+        with self._lock, self._conn:
+            return sum(self._write(*item, overwrite) is not None for item in items)
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT lang, COUNT(*) FROM posts GROUP BY lang").fetchall()
+        return {"path": self.path, "languages": dict(rows)}
+
+
+# ============================================================
+# Migration from data/blog/<slug>/<lang>.json
+# ============================================================
+def read_directory(blog_dir: str, skip=None) -> list:
+    """
+    [(slug, lang, data, mtime)] for every post file in the legacy layout,
+    except those for which `skip(slug, lang, mtime)` is true (not parsed).
+    """
+    items = []
+    if not os.path.isdir(blog_dir):
+        return items
+    for entry in sorted(os.scandir(blog_dir), key=lambda e: e.name):
+        if not entry.is_dir() or entry.name in SKIP_DIRS:
+            continue
+        for f in sorted(os.scandir(entry.path), key=lambda e: e.name):
+            if not (f.is_file() and f.name.endswith(".json")):
+                continue
+            mtime = f.stat().st_mtime
+            if skip is not None and skip(entry.name, f.name[:-5], mtime):
+                continue
+            try:
+                with open(f.path, "r", encoding="utf-8") as fh:
+                    data = json.load(fh)
+            except Exception as e:
+                print(f"[blog-store] skipping {f.path}: {e}")
+                continue
+            items.append((entry.name, f.name[:-5], data, mtime))
+    return items
+
+
+def migrate_directory(store: BlogStore, blog_dir: str = LEGACY_BLOG_DIR, overwrite: bool = False) -> int:
+    """
+    Import post files that are missing from the store or newer than the
+    stored post (all of them with `overwrite`). File mtimes become
+    updated_at. Returns posts written.
+    """
+    stored = {} if overwrite else store.updated_times()
+
+    def unchanged(slug, lang, mtime):
+        return (slug, lang) in stored and stored[(slug, lang)] >= mtime
+
+    return store.put_many(read_directory(blog_dir, skip=unchanged))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> BlogStore:
+    """Process-wide store at BLOG_DB, with new / changed files from data/blog imported."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            store = BlogStore(BLOG_DB)
+            n = migrate_directory(store, LEGACY_BLOG_DIR)
+            if n:
+                print(f"[blog-store] imported {n} post(s) from {LEGACY_BLOG_DIR}")
+            _store = store
+        return _store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import data/blog/<slug>/<lang>.json posts into the blog database")
+    parser.add_argument("--blog-dir", default=LEGACY_BLOG_DIR, help="legacy blog directory")
+    parser.add_argument("--db", default=BLOG_DB, help="SQLite database to write (BLOG_DB)")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="re-import every file (default: only files missing from the db or newer than it)")
+    args = parser.parse_args()
+
+    store = BlogStore(args.db)
+    n = migrate_directory(store, args.blog_dir, overwrite=args.overwrite)
+    print(f"Imported {n} post(s): {args.blog_dir} -> {args.db} ({store.count()} total)")
@@ -0,0 +1,232 @@
+import json
+import time
+import uuid
+import asyncio
+import threading
+
+from ai.context import count_tokens
+from utils.sqlite import connect
+
+
+SWEEP_INTERVAL = 60.0   # seconds between expiry sweeps
+
+
+class ChatSession:
+    def __init__(self, session_id: str, summary: str = "", turns: list = None, updated_at: float = None,
+                 version: int = 0, persistent: bool = True):
+        self.id = session_id
+        self.summary = summary          # running summary of turns rolled out of `turns`
+        self.turns = turns or []        # recent [{"role": ..., "content": ...}]
+        self.updated_at = updated_at or time.time()
+        self.version = version          # bumped on every stored change
+        self.persistent = persistent    # False: one-off session, never stored or compacted
+
+
+class ChatSessionStore:
+    """
+    Server-side chat history keyed by a conversation id.
+
+    Without `db_path` sessions live in this process's memory. With it they
+    live in a local SQLite file so they survive restarts and are shared by
+    every worker: each request re-reads its session from the database, and
+    every change is a read-modify-write in one transaction, so a worker
+    never overwrites turns another worker just added. Database work runs
+    in a thread, off the event loop. Sessions idle for longer than `ttl`
+    seconds are dropped.
+
+    Recent turns are kept within `history_tokens`; once they grow past it,
+    the oldest turns are folded into `summary` by compact(), which callers
+    run after the reply has been sent so it never adds to turn latency.
+    """
+
+    def __init__(self, ttl: float = 6 * 3600, history_tokens: int = 1200, db_path: str = None):
+        self.ttl = ttl
+        self.history_tokens = history_tokens
+        self._sessions = {}     # only used without a database
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self._swept_at = 0.0
+        self._conn = None
+        if db_path:
+            self._conn = connect(db_path, (
+                "CREATE TABLE IF NOT EXISTS chat_sessions ("
+                "  id         TEXT PRIMARY KEY,"
+                "  summary    TEXT NOT NULL,"
+                "  turns      TEXT NOT NULL,"
+                "  updated_at REAL NOT NULL,"
+                "  version    INTEGER NOT NULL DEFAULT 0"
+                ")",
+            ))
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chat_sessions)")}
+            if "version" not in columns:   # databases created before versioning
+                self._conn.execute("ALTER TABLE chat_sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            self._conn.commit()
+
+    # ── storage ─────────────────────────────────────────────────────────────
+
+    def _load(self, session_id: str):
+        """Caller holds self._lock."""
+        row = self._conn.execute(
+            "SELECT summary, turns, updated_at, version FROM chat_sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return ChatSession(session_id, row[0], json.loads(row[1]), row[2], row[3])
+
+    def _update(self, session: ChatSession, change) -> bool:
+        """
+        Apply `change(current)` to the latest stored copy of `session` and
+        store it; `change` returns False to leave it untouched. `session` is
+        refreshed to the stored state. Returns whether anything was written.
+        """
+        if self._conn is None:
+            current = self._sessions.get(session.id) or session
+            if change(current) is False:
+                return False
+            current.version += 1
+            current.updated_at = time.time()
+            self._sessions[session.id] = current
+            self._copy(current, session)
+            return True
+
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so the read below is
+            # the row we replace even with other workers writing
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                current = self._load(session.id) or ChatSession(session.id)
+                if change(current) is False:
+                    self._conn.rollback()
+                    return False
+                current.version += 1
+                current.updated_at = time.time()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO chat_sessions (id, summary, turns, updated_at, version) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (current.id, current.summary, json.dumps(current.turns, ensure_ascii=False),
+                     current.updated_at, current.version),
+                )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        self._copy(current, session)
+        return True
+
+    async def _offload(self, fn, *args):
+        # sqlite3 blocks (up to its busy timeout); memory-only stores stay on the loop
+        if self._conn is None:
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    @staticmethod
+    def _copy(src: ChatSession, dst: ChatSession) -> None:
+        if src is not dst:
+            dst.summary, dst.turns = src.summary, list(src.turns)
+            dst.updated_at, dst.version = src.updated_at, src.version
+
+    def _sweep(self) -> None:
+        now = time.time()
+        if now - self._swept_at < SWEEP_INTERVAL:
+            return
+        self._swept_at = now
+        cutoff = now - self.ttl
+        for sid in [sid for sid, s in self._sessions.items() if s.updated_at < cutoff]:
+            del self._sessions[sid]
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("DELETE FROM chat_sessions WHERE updated_at < ?", (cutoff,))
+                self._conn.commit()
+
+    async def get_or_create(self, session_id: str = None) -> ChatSession:
+        return await self._offload(self._get_or_create, session_id)
+
+    def _get_or_create(self, session_id: str = None) -> ChatSession:
+        self._sweep()
+        if session_id:
+            if self._conn is not None:
+                # Always the stored copy: another worker may have added turns
+                with self._lock:
+                    session = self._load(session_id)
+            else:
+                session = self._sessions.get(session_id)
+            if session is not None:
+                return session
+        return ChatSession(session_id or uuid.uuid4().hex)
+
+    def ephemeral(self, turns: list) -> ChatSession:
+        """Session for a request that brings its own history; never stored."""
+        return ChatSession(uuid.uuid4().hex, turns=list(turns), persistent=False)
+
+    def delete(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,))
+                self._conn.commit()
+
+    async def add_turn(self, session: ChatSession, user_message: str, reply: str) -> None:
+        if not session.persistent:
+            return
+        turn = [{"role": "user", "content": user_message}, {"role": "assistant", "content": reply}]
+        await self._offload(self._update, session, lambda current: current.turns.extend(turn))
+
+    # ── compaction ──────────────────────────────────────────────────────────
+
+    def _history_size(self, turns) -> int:
+        return sum(count_tokens(t["content"]) for t in turns)
+
+    async def compact(self, session: ChatSession, summarize) -> None:
+        """
+        Fold the oldest turns into the running summary until the remaining
+        turns use at most half the budget. `summarize(summary, turns)` is an
+        async callable returning the new summary text.
+        """
+        if not session.persistent or self._history_size(session.turns) <= self.history_tokens:
+            return
+
+        keep, used = [], 0
+        for turn in reversed(session.turns):
+            cost = count_tokens(turn["content"])
+            if keep and used + cost > self.history_tokens // 2:
+                break
+            keep.insert(0, turn)
+            used += cost
+        old = session.turns[:len(session.turns) - len(keep)]
+        if not old:
+            return
+
+        base_summary = session.summary
+        summary = await summarize(base_summary, old)
+
+        def fold(current):
+            # Someone else compacted meanwhile: their summary wins
+            if current.summary != base_summary or current.turns[:len(old)] != old:
+                return False
+            current.summary = summary
+            # Turns added while the summary was generated stay in place
+            current.turns = current.turns[len(old):]
+
+        await self._offload(self._update, session, fold)
+
+    def compact_in_background(self, session: ChatSession, summarize) -> None:
+        if not session.persistent:
+            return
+
+        async def run():
+            try:
+                await self.compact(session, summarize)
+            except Exception as e:
+                print(f"[chat] history compaction failed for {session.id}: {e}")
+
+        task = asyncio.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> dict:
+        return {
+            "sessions_in_memory": len(self._sessions),
+            "persistent": self._conn is not None,
+            "ttl": self.ttl,
+            "history_tokens": self.history_tokens,
+        }
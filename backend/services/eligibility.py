@@ -0,0 +1,227 @@
+"""
+Eligibility Pre-Scorer
+======================
+Scores assessment profiles against every program in visa_programs.json
+locally, without an LLM call.
+
+Program requirements are compiled once into NumPy arrays (one slot per
+program). A profile is encoded into the same ordinal scales, and all
+programs are scored in one broadcast pass. Scoring N profiles at once is the
+same code with an (N, programs) matrix, which is what the CRM batch API
+uses.
+
+A program can describe its requirements in visa_programs.json:
+
+    "requirements": {
+        "goal": "Startup",                # Study | Startup | Work | Residency
+        "min_budget_usd": 15000,
+        "min_english": "Intermediate",    # Basic | Intermediate | Advanced | IELTS 6.5+
+        "min_education": "Bachelor",      # High School | Bachelor | Master | PhD
+        "age_min": 18, "age_max": 45,
+        "processing_months": 3
+    }
+
+Anything left out is treated as "no requirement"; the goal falls back to the
+program's category. The ordinal scales match the options in the assessment
+form (frontend/src/pages/Assessment.jsx).
+"""
+
+import numpy as np
+
+GOALS = ["Study", "Startup", "Work", "Residency"]
+CATEGORY_GOALS = {
+    "study": "Study", "student": "Study",
+    "startup": "Startup", "entrepreneur": "Startup",
+    "work": "Work", "job": "Work",
+    "residency": "Residency", "investment": "Residency", "golden": "Residency",
+}
+EDUCATION = ["High School", "Bachelor", "Master", "PhD"]
+ENGLISH = ["Basic", "Intermediate", "Advanced", "IELTS 6.5+"]
+BUDGET_BANDS = ["< $15k", "$15k – $50k", "$50k – $150k", "$150k+"]
+BUDGET_FLOORS = np.array([0, 15_000, 50_000, 150_000], dtype="float32")   # USD, lower edge of each band
+AGE_BANDS = {"18 – 25": 21.5, "26 – 35": 30.5, "36 – 45": 40.5, "45+": 50.0}
+TIMELINE_MONTHS = {"ASAP": 3, "6–12 months": 12, "1–2 years": 24, "Flexible": 36}
+
+# Component weights (sum to 1) — goal fit dominates: a perfect Work profile
+# is still a poor match for a Study visa
+WEIGHTS = {"goal": 0.35, "budget": 0.2, "english": 0.15, "education": 0.15, "age": 0.1, "timeline": 0.05}
+NEUTRAL = 0.5          # component score when the profile leaves a field empty
+GAP_THRESHOLD = 0.75   # components below this are reported as gaps
+
+
+def _key(value) -> str:
+    # The form uses "–" (en dash) in ranges; API clients often send "-"
+    return str(value).strip().replace(" - ", " – ").casefold()
+
+
+def _table(labels) -> dict:
+    """{normalized label: number} for a scale (list) or a label -> number dict."""
+    items = labels.items() if isinstance(labels, dict) else ((label, i) for i, label in enumerate(labels))
+    return {_key(label): float(number) for label, number in items}
+
+
+# profile field -> lookup table
+ENCODERS = {
+    "goal": ("goal", _table(GOALS)),
+    "budget": ("budget", _table(BUDGET_BANDS)),
+    "english": ("english", _table(ENGLISH)),
+    "education": ("education", _table(EDUCATION)),
+    "age": ("age_range", _table(AGE_BANDS)),
+    "timeline": ("timeline", _table(TIMELINE_MONTHS)),
+}
+
+
+def _ordinal(scale: list, value) -> float:
+    """Position of `value` on `scale`, NaN if missing or unknown."""
+    if value is None:
+        return np.nan
+    return _table(scale).get(_key(value), np.nan)
+
+
+class EligibilityScorer:
+    def __init__(self, programs: list):
+        self.programs = [p for p in programs or [] if isinstance(p, dict)]
+        n = len(self.programs)
+        self.goal = np.full(n, np.nan, dtype="float32")
+        self.budget = np.zeros(n, dtype="float32")        # min band index
+        self.english = np.zeros(n, dtype="float32")
+        self.education = np.zeros(n, dtype="float32")
+        self.age_min = np.full(n, -np.inf, dtype="float32")
+        self.age_max = np.full(n, np.inf, dtype="float32")
+        self.processing = np.zeros(n, dtype="float32")    # months
+
+        for i, program in enumerate(self.programs):
+            req = program.get("requirements") or {}
+            goal = req.get("goal") or CATEGORY_GOALS.get(str(program.get("category", "")).lower())
+            self.goal[i] = _ordinal(GOALS, goal)
+            if req.get("min_budget_usd") is not None:
+                # Highest band whose lower edge is still below the requirement
+                self.budget[i] = max(0, np.searchsorted(BUDGET_FLOORS, float(req["min_budget_usd"]), side="right") - 1)
+            self.english[i] = np.nan_to_num(_ordinal(ENGLISH, req.get("min_english")))
+            self.education[i] = np.nan_to_num(_ordinal(EDUCATION, req.get("min_education")))
+            if req.get("age_min") is not None:
+                self.age_min[i] = req["age_min"]
+            if req.get("age_max") is not None:
+                self.age_max[i] = req["age_max"]
+            self.processing[i] = req.get("processing_months") or 0
+
+        self._cards = [
+            {"title": p.get("title", ""), "country": p.get("country", ""), "category": p.get("category", "")}
+            for p in self.programs
+        ]
+
+    def __len__(self):
+        return len(self.programs)
+
+    # ── encoding ────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def encode(profiles: list) -> dict:
+        """Column arrays (one row per profile) from AssessmentInput-like dicts."""
+        nan = np.nan
+        return {
+            name: np.array(
+                [table.get(_key(p[field]), nan) if p.get(field) is not None else nan for p in profiles],
+                dtype="float32",
+            )
+            for name, (field, table) in ENCODERS.items()
+        }
+
+    # ── scoring ─────────────────────────────────────────────────────────────
+
+    def components(self, encoded: dict) -> dict:
+        """Per-component scores in [0, 1], each of shape (profiles, programs)."""
+        col = {k: v[:, None] for k, v in encoded.items()}   # broadcast against programs
+
+        def ordinal_fit(have, need, step):
+            return np.clip(1.0 - step * np.maximum(need - have, 0.0), 0.0, 1.0)
+
+        with np.errstate(invalid="ignore"):
+            parts = {
+                "goal": np.where(col["goal"] == self.goal, 1.0, 0.0),
+                "budget": ordinal_fit(col["budget"], self.budget, 0.5),
+                "english": ordinal_fit(col["english"], self.english, 0.4),
+                "education": ordinal_fit(col["education"], self.education, 0.4),
+                "age": np.clip(1.0 - 0.1 * (np.maximum(self.age_min - col["age"], 0.0)
+                                            + np.maximum(col["age"] - self.age_max, 0.0)), 0.0, 1.0),
+                "timeline": np.where(self.processing > col["timeline"],
+                                     col["timeline"] / np.maximum(self.processing, 1.0), 1.0),
+            }
+        for name, value in parts.items():
+            # An unanswered question neither helps nor rules a program out
+            parts[name] = np.where(np.isnan(col[name]), NEUTRAL, value).astype("float32")
+        return parts
+
+    def score(self, encoded: dict):
+        """
+        (profiles, programs) matrix of scores 0-100, and a boolean
+        (profiles, programs, components) matrix of answered-but-unmet requirements.
+        """
+        parts = self.components(encoded)
+        total = sum(WEIGHTS[name] * value for name, value in parts.items())
+        gaps = np.stack([
+            (parts[name] < GAP_THRESHOLD) & ~np.isnan(encoded[name])[:, None] for name in WEIGHTS
+        ], axis=-1)
+        return np.rint(total * 100), gaps
+
+    def shortlist(self, profiles: list, top_k: int = 3) -> list:
+        """Ranked [{title, country, category, score, gaps}] per profile."""
+        if not self.programs or not profiles:
+            return [[] for _ in profiles]
+        scores, gaps = self.score(self.encode(profiles))
+        k = min(top_k, len(self.programs))
+        # argpartition picks the top k without sorting every program
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        rows = np.arange(len(profiles))[:, None]
+        top = np.take_along_axis(top, np.argsort(-scores[rows, top], axis=1, kind="stable"), axis=1)
+        top_scores = scores[rows, top].astype(int).tolist()
+        top_gaps = gaps[rows, top].tolist()
+
+        names = list(WEIGHTS)
+        return [
+            [
+                {**self._cards[j], "score": score, "gaps": [n for n, g in zip(names, gap) if g]}
+                for j, score, gap in zip(candidates, row_scores, row_gaps)
+            ]
+            for candidates, row_scores, row_gaps in zip(top.tolist(), top_scores, top_gaps)
+        ]
+
+
+def shortlist_context(shortlist: list) -> str:
+    """Compact prompt section listing the locally pre-scored candidates."""
+    if not shortlist:
+        return ""
+    lines = ["CANDIDATE PROGRAMS (pre-scored locally, 0-100; gaps = requirements the profile may not meet):"]
+    for c in shortlist:
+        gaps = ", ".join(c["gaps"]) or "none"
+        lines.append(f"  - {c['title']} ({c['country']}, {c['category']}): {c['score']} — gaps: {gaps}")
+    return "\n".join(lines)
+
+
+GAP_NOTES = {
+    "goal": "This program is built for a different goal than the one you selected.",
+    "budget": "Your budget may be below what this pathway typically requires.",
+    "english": "Your English level may be below the typical requirement.",
+    "education": "Your education level may be below the typical requirement.",
+    "age": "Your age range falls outside the program's usual limits.",
+    "timeline": "Processing usually takes longer than your preferred timeline.",
+}
+
+
+def fast_assessment(shortlist: list) -> dict:
+    """/api/assess response built from the local shortlist alone (fast=true)."""
+    if not shortlist:
+        return {"score": 0, "visa": "", "summary": "No matching programs found.",
+                "missing_docs": [], "risks": [], "steps": [], "shortlist": [], "mode": "fast"}
+    best = shortlist[0]
+    return {
+        "score": best["score"],
+        "visa": best["title"],
+        "summary": f"Based on your profile, {best['title']} ({best['country']}) is the closest match "
+                   f"with a preliminary score of {best['score']}/100.",
+        "missing_docs": [],
+        "risks": [GAP_NOTES[g] for g in best["gaps"]],
+        "steps": ["Book a consultation for a detailed, document-level evaluation."],
+        "shortlist": shortlist,
+        "mode": "fast",
+    }
@@ -0,0 +1,105 @@
+import json
+import time
+import uuid
+import asyncio
+import threading
+
+from utils.sqlite import connect
+
+
+class SuggestionJobs:
+    """
+    Background AI-suggestion jobs for two-phase /api/search.
+
+    submit() starts the work as an asyncio task and returns a ticket at once.
+    Status and result are kept in a small SQLite table (WAL), so a follow-up
+    request can be answered by any uvicorn worker, not just the one that ran
+    the job; table access runs in a thread so it never blocks the event
+    loop. Tickets expire after `ttl` seconds.
+    """
+
+    def __init__(self, path: str, ttl: float = 300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = connect(path, (
+            "CREATE TABLE IF NOT EXISTS tickets ("
+            "  ticket     TEXT PRIMARY KEY,"
+            "  status     TEXT NOT NULL,"
+            "  result     TEXT,"
+            "  created_at REAL NOT NULL"
+            ")",
+        ))
+        self._tasks = set()       # strong refs so running tasks aren't GC'd
+        self._done = {}           # ticket -> asyncio.Event for jobs run by this worker
+
+    def _execute_sync(self, sql: str, params=()):
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+            self._conn.commit()
+        return rows
+
+    async def _execute(self, sql: str, params=()):
+        # sqlite3 blocks (up to its busy timeout), so keep it off the event loop
+        return await asyncio.to_thread(self._execute_sync, sql, params)
+
+    async def submit(self, coro) -> str:
+        """Run `coro` in the background; its return value becomes the ticket result."""
+        ticket = uuid.uuid4().hex
+        now = time.time()
+        await self._execute("DELETE FROM tickets WHERE created_at < ?", (now - self.ttl,))
+        await self._execute(
+            "INSERT INTO tickets (ticket, status, created_at) VALUES (?, 'pending', ?)",
+            (ticket, now),
+        )
+
+        done = self._done[ticket] = asyncio.Event()
+
+        async def run():
+            try:
+                result = await coro
+                await self._execute(
+                    "UPDATE tickets SET status = 'ready', result = ? WHERE ticket = ?",
+                    (json.dumps(result, ensure_ascii=False), ticket),
+                )
+            except Exception as e:
+                print("=== suggestion job ERROR ===")
+                print(str(e))
+                await self._execute("UPDATE tickets SET status = 'error' WHERE ticket = ?", (ticket,))
+            finally:
+                done.set()
+                self._done.pop(ticket, None)
+
+        task = asyncio.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return ticket
+
+    async def _lookup(self, ticket: str):
+        rows = await self._execute("SELECT status, result FROM tickets WHERE ticket = ?", (ticket,))
+        if not rows:
+            return None
+        status, result = rows[0]
+        return {"status": status, "ai": json.loads(result) if result else None}
+
+    async def get(self, ticket: str, wait: float = 0):
+        """
+        Return {"status": "pending"|"ready"|"error", "ai": ...} or None for an
+        unknown/expired ticket. With wait > 0, long-poll up to `wait` seconds.
+        """
+        deadline = time.monotonic() + wait
+        while True:
+            job = await self._lookup(ticket)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] != "pending" or remaining <= 0:
+                return job
+
+            done = self._done.get(ticket)
+            if done is not None:
+                # Ours: wake as soon as the task finishes
+                try:
+                    await asyncio.wait_for(done.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                # Running in another worker: poll the shared table
+                await asyncio.sleep(min(0.1, remaining))
@@ -0,0 +1,63 @@
+"""
+HTTP conditional-request helpers (ETag / Last-Modified / 304).
+
+Endpoints compute their validators cheaply (a cached content hash, a file
+mtime) and call not_modified() BEFORE loading anything; when the client or
+CDN already holds the current representation they answer with
+not_modified_response() and skip the body entirely.
+"""
+
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import Request, Response
+
+# Cache-Control per kind of resource. Posts rarely change once published;
+# the listing changes whenever one is. stale-while-revalidate lets the CDN
+# keep serving while it revalidates with a (cheap) conditional request.
+POST_CACHE_CONTROL = "public, max-age=300, s-maxage=3600, stale-while-revalidate=86400"
+LIST_CACHE_CONTROL = "public, max-age=30, s-maxage=60, stale-while-revalidate=600"
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag from the given parts (already-hashed content, variant, params)."""
+    digest = hashlib.sha256("\x00".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def not_modified(request: Request, etag: str, last_modified: float = None) -> bool:
+    """
+    True when the client's copy is current. If-None-Match wins over
+    If-Modified-Since when both are sent (RFC 9110 §13.2.2).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # Compare opaque tags; a W/ prefix from an intermediary still matches
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since   # HTTP dates have 1-second resolution
+    return False
+
+
+def cache_headers(etag: str, last_modified: float = None, cache_control: str = POST_CACHE_CONTROL) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
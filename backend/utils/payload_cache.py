@@ -0,0 +1,130 @@
+"""
+Pre-serialized, pre-compressed response cache.
+
+Stores the final JSON bytes of a response together with gzip and brotli
+variants, built once (first request after publish) and then served as-is:
+a hit is a dict lookup and a memory copy instead of load + serialize +
+compress. Entries are keyed by a content version, so a changed post simply
+misses; invalidate() drops a post's entries right away when it is rewritten.
+Least recently used entries are evicted once the stored bytes exceed the
+byte budget.
+
+brotli is optional: without it only gzip and identity are offered.
+"""
+
+import gzip
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:   # optional dependency
+    brotli = None
+
+MIN_COMPRESS_BYTES = 1024   # smaller bodies aren't worth the encoding overhead
+GZIP_LEVEL = 9              # compressed once per version, so favor ratio over speed
+BROTLI_QUALITY = 9
+
+
+def encodings_offered() -> tuple:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding: str) -> str:
+    """Best encoding the client accepts: br > gzip > identity (honors q=0)."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    for coding in encodings_offered():
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return "identity"
+
+
+def serialize(content) -> bytes:
+    """Same bytes FastAPI's JSONResponse would produce."""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+class Payload:
+    def __init__(self, body: bytes):
+        self.variants = {"identity": body}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            self.variants["gzip"] = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+        self.size = sum(len(v) for v in self.variants.values())
+
+    def get(self, encoding: str):
+        """(bytes, content-encoding or None) — falls back to identity."""
+        if encoding in self.variants and encoding != "identity":
+            return self.variants[encoding], encoding
+        return self.variants["identity"], None
+
+
+class PayloadCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> Payload
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def get_or_build(self, key, build) -> Payload:
+        """Cached payload for `key`; on a miss `build()` returns the content to serialize."""
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return payload
+            self.misses += 1
+
+        payload = Payload(serialize(build()))   # outside the lock: compression takes a while
+        if payload.size > self.max_bytes:
+            return payload
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = payload
+            self._bytes += payload.size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evicted += 1
+        return payload
+
+    def invalidate(self, prefix: tuple) -> None:
+        """Drop every entry whose key starts with `prefix` (e.g. (slug, lang))."""
+        with self._lock:
+            for key in [k for k in self._entries if k[:len(prefix)] == prefix]:
+                self._bytes -= self._entries.pop(key).size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evicted": self.evicted,
+            "encodings": ["identity", *encodings_offered()],
+        }
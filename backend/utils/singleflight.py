@@ -0,0 +1,42 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical async calls.
+
+    The first caller for a key starts the upstream call; everyone who asks for
+    the same key while it is in flight awaits that one call and gets the same
+    result — or the same exception. The call runs as its own task, so a
+    disconnecting first caller doesn't cancel it for the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight = {}   # key -> asyncio.Task
+        self.calls = 0        # upstream calls actually made
+        self.collapsed = 0    # callers that piggybacked on an in-flight call
+
+    async def do(self, key, fn, *args, **kwargs):
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.collapsed += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        requests = self.calls + self.collapsed
+        return {
+            "calls": self.calls,
+            "collapsed": self.collapsed,
+            "collapse_rate": round(self.collapsed / requests, 4) if requests else 0.0,
+            "in_flight": len(self._inflight),
+        }
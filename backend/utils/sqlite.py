@@ -0,0 +1,22 @@
+import os
+import sqlite3
+
+
+def connect(path: str, schema=()) -> sqlite3.Connection:
+    """
+    Open a local SQLite database shared by threads and uvicorn workers.
+
+    Creates the parent directory, switches to WAL (readers never block the
+    writer) with synchronous=NORMAL, runs the `schema` statements and
+    commits. The connection may be used from any thread, so callers guard
+    it with their own threading.Lock. A busy database is waited on for up
+    to 30 seconds rather than failing at once.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    for statement in schema:
+        conn.execute(statement)
+    conn.commit()
+    return conn
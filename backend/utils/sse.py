@@ -0,0 +1,32 @@
+import json
+
+# Headers that stop proxies (nginx, Railway edge) from buffering the stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def sse_chat_stream(events, sources=None, meta=None):
+    """
+    Turn stream_completion() events into SSE:
+      event: token  {"content": "..."}     — one per generated delta
+      event: done   {"sources": [...], "usage": {...}, **meta}
+      event: error  {"detail": "..."}      — if the upstream call fails
+    """
+    try:
+        async for item in events:
+            if item["type"] == "token":
+                yield sse_event("token", {"content": item["content"]})
+            elif item["type"] == "usage":
+                usage = {k: v for k, v in item.items() if k != "type"}
+                yield sse_event("done", {"sources": sources or [], "usage": usage, **(meta or {})})
+    except Exception as e:
+        print("=== SSE stream ERROR ===")
+        print(str(e))
+        yield sse_event("error", {"detail": "Chat failed"})
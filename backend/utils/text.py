@@ -0,0 +1,102 @@
+import re
+import unicodedata
+
+# Arabic code points that have a Persian counterpart (or are pure decoration)
+_CHAR_MAP = str.maketrans({
+    "ي": "ی",   # ي  Arabic yeh        -> ی
+    "ى": "ی",   # ى  alef maksura      -> ی
+    "ك": "ک",   # ك  Arabic kaf        -> ک
+    "ة": "ه",   # ة  teh marbuta       -> ه
+    "ۀ": "ه",   # ۀ  heh with yeh      -> ه
+    "أ": "ا",   # أ  alef hamza above  -> ا
+    "إ": "ا",   # إ  alef hamza below  -> ا
+    "ٱ": "ا",   # ٱ  alef wasla        -> ا
+    "\u0640": None,       # ـ  tatweel
+    "\u200b": " ",        # zero width space
+    "\u200c": " ",        # ZWNJ (نیم‌فاصله)
+    "\u200d": " ",        # zero width joiner
+    "\ufeff": " ",        # BOM
+})
+
+# Persian ۰-۹ and Arabic ٠-٩ digits -> ASCII
+_DIGITS = str.maketrans(
+    "۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩",
+    "01234567890123456789",
+)
+
+# Harakat / tanwin / superscript alef
+_DIACRITICS = re.compile(r"[\u064b-\u065f\u0670]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Canonical form for Persian/English text used as a cache or index key:
+    Arabic letters unified to Persian, diacritics and tatweel dropped,
+    ZWNJ and runs of whitespace folded to a single space, case folded.
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text)
+    text = text.translate(_CHAR_MAP).translate(_DIGITS)
+    text = _DIACRITICS.sub("", text)
+    text = _WHITESPACE.sub(" ", text).strip()
+    return text.casefold()
+
+
+def _variants() -> dict:
+    """Normalized character -> every raw character normalize_text maps to it."""
+    inverse = {}
+    for table in (_CHAR_MAP, _DIGITS):
+        for src, dst in table.items():
+            dst = chr(dst) if isinstance(dst, int) else dst
+            if dst and dst.strip():
+                inverse.setdefault(dst, {dst}).add(chr(src))
+    return inverse
+
+
+_VARIANTS = _variants()
+_IGNORABLE = "[\u0640\u064b-\u065f\u0670]*"   # tatweel / diacritics inside a word
+
+
+def term_pattern(token: str) -> str:
+    """
+    Regex matching `token` (a normalized search token) in raw, un-normalized
+    text — e.g. "کتاب" also matches "كتاب" and "کـتاب". Compile with
+    re.IGNORECASE for Latin text.
+    """
+    parts = []
+    for ch in token:
+        chars = _VARIANTS.get(ch)
+        parts.append("[" + "".join(re.escape(c) for c in sorted(chars)) + "]" if chars else re.escape(ch))
+    return _IGNORABLE.join(parts)
+
+
+_TOKEN = re.compile(r"\w+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from how i in is it of on or the to what with you your
+و در به از که این را با برای آن یک تا است ها های می هم یا بر شود کنید
+""".split())
+
+
+def tokenize(text: str) -> list:
+    """
+    Split normalized text into search tokens. ZWNJ compounds are split into
+    their parts; stopwords and single letters are dropped, digits kept.
+    """
+    return [
+        tok for tok in _TOKEN.findall(normalize_text(text))
+        if tok not in STOPWORDS and (len(tok) > 1 or tok.isdigit())
+    ]
+
+
+_ARABIC_SCRIPT = re.compile(r"[\u0600-\u06ff]")
+_LATIN = re.compile(r"[a-zA-Z]")
+
+
+def detect_lang(text: str) -> str:
+    """Rough "fa" / "en" guess by which script dominates the text."""
+    persian = len(_ARABIC_SCRIPT.findall(text or ""))
+    latin = len(_LATIN.findall(text or ""))
+    return "fa" if persian > latin else "en"